@@ -1,8 +1,22 @@
 #!/usr/bin/env python3
+"""
+Set header metadata (user, sn, eraser, bulb) of existing .jl files
+
+The new header is written to a temp file, the rest of the .jl copied after it
+in chunks and the temp file renamed over the original, so a crash leaves
+either the old or the new file
+Files whose header already matches aren't touched
+"""
 
 import argparse
-import glob
 import json
+import multiprocessing
+import os
+import shutil
+import sys
+import eetime.jl
+
+COPY_CHUNK = 1 << 20
 
 
 def mk_header(j, user=None, sn=None, eraser=None, bulb=None):
@@ -17,22 +31,101 @@ def mk_header(j, user=None, sn=None, eraser=None, bulb=None):
     return json.dumps(j) + '\n'
 
 
-def process(fn, **kwargs):
-    print("Opening %s" % (fn, ))
-    out = ""
-    f = open(fn, "r")
-    orig_header = json.loads(f.readline())
-    out += mk_header(orig_header, **kwargs)
-    out += f.read()
-    f.close()
+def header_changes(j, **kwargs):
+    """{key: (old, new)} mk_header() would make to header j"""
+    new = json.loads(mk_header(dict(j), **kwargs))
+    ret = {}
+    for k, v in new.items():
+        if j.get(k) != v:
+            ret[k] = (j.get(k), v)
+    return ret
+
+
+def complete(fn):
+    """Run has ended (footer / timeout), so nothing is appending to it"""
+    j = eetime.jl.last_record(fn)
+    return j is not None and j["type"] in ("footer", "timeout")
+
+
+def process(fn, dry_run=False, force=False, **kwargs):
+    """
+    Annotate one .jl. Returns True if its header changed (or would have)
+    Prints what changed in one go so parallel output doesn't interleave
+    force: also annotate runs that haven't ended. Anything collect.py
+        appends while the file is rewritten is lost
+    """
+    if not force and not complete(fn):
+        print("%s: run in progress (no footer), skipping" % (fn, ))
+        return False
+    with open(fn, "rb") as f:
+        orig_header = json.loads(f.readline())
+        changes = header_changes(orig_header, **kwargs)
+        if not changes:
+            print("%s: up to date" % (fn, ))
+            return False
+        lines = [fn]
+        for k, (old, new) in sorted(changes.items()):
+            lines.append("  %s: %s => %s" %
+                         (k, json.dumps(old), json.dumps(new)))
+        print("\n".join(lines))
+        if dry_run:
+            return True
+
+        size = os.fstat(f.fileno()).st_size
+        tmp = fn + ".tmp"
+        with open(tmp, "wb") as out:
+            out.write(mk_header(orig_header, **kwargs).encode("utf-8"))
+            shutil.copyfileobj(f, out, COPY_CHUNK)
+            out.flush()
+            os.fsync(out.fileno())
+        if os.path.getsize(fn) != size:
+            os.remove(tmp)
+            raise Exception("%s changed while annotating (run in progress?)" %
+                            fn)
+        shutil.copymode(fn, tmp)
+    os.replace(tmp, fn)
+    eetime.jl.fsync_dir(fn)
+    return True
+
 
-    with open(fn, "w") as f:
-        f.write(out)
+def process_task(task):
+    """
+    process() one file. Runs in a worker process w/ --jobs
+    Returns (changed, exception) so one bad file doesn't stop the rest
+    """
+    fn, kwargs = task
+    try:
+        return process(fn, **kwargs), None
+    except Exception as e:
+        return False, e
 
 
-def run(d, **kwargs):
-    for fn in sorted(glob.glob(d + "/*.jl")):
-        process(fn, **kwargs)
+def run(d, recursive=False, jobs=None, **kwargs):
+    """
+    recursive: every directory with .jl files at or below d
+    jobs: annotate this many files in parallel (default: CPU count)
+    """
+    if recursive:
+        from csv_runs import find_jl_dirs
+        fns = eetime.jl.expand_jls_arg(list(find_jl_dirs(d)))
+    else:
+        fns = eetime.jl.expand_jls_arg([d])
+    tasks = [(fn, kwargs) for fn in fns]
+    if jobs == 1 or len(tasks) <= 1:
+        results = [process_task(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.map(process_task, tasks)
+    changed = 0
+    failed = 0
+    for fn, (this_changed, exception) in zip(fns, results):
+        changed += this_changed
+        if exception:
+            print("WARNING: %s: %s" % (fn, exception))
+            failed += 1
+    verb = "Would annotate" if kwargs.get("dry_run") else "Annotated"
+    print("%s %u / %u files, %u failed" % (verb, changed, len(fns), failed))
+    return failed
 
 
 def main():
@@ -41,16 +134,35 @@ def main():
     parser.add_argument('--user')
     parser.add_argument('--sn')
     parser.add_argument('--eraser')
+    parser.add_argument('--dry-run',
+                        action="store_true",
+                        help="Show what would change without writing")
+    parser.add_argument('--force',
+                        action="store_true",
+                        help="Also annotate runs without a footer")
+    parser.add_argument('--recursive',
+                        action="store_true",
+                        help="Annotate every run directory below dir")
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=None,
+                        help='Files in parallel (default: CPU count)')
     parser.add_argument('dir', help='Directory to annotate')
     args = parser.parse_args()
 
-    run(
+    failed = run(
         args.dir,
+        recursive=args.recursive,
+        jobs=args.jobs,
+        dry_run=args.dry_run,
+        force=args.force,
         bulb=args.bulb,
         user=args.user,
         sn=args.sn,
         eraser=args.eraser,
     )
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
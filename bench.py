@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the collection and analysis hot paths
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import collect
+from eetime import erase
+from eetime import frames
+
+# 2 KiB (2716) to 4 MiB (27C322)
+SIZES = [2**n * 1024 for n in range(1, 13)]
+# Synthetic runs: (device bytes, reads). Big parts erase in fewer reads
+RUNS = [(2048, 2000), (32768, 500), (524288, 100), (4194304, 50)]
+# csv_runs corpus: S/Ns x bulbs x passes of (bytes, reads)
+CORPUS_SNS = 4
+CORPUS_BULBS = ("2", "3")
+CORPUS_PASSES = 2
+CORPUS_RUN = (32768, 200)
+# Runs per stats.py --fit batch
+FIT_RUNS = 1000
+# frame_size: reads taken over one erase (a 300 s t50 at a 3 s --interval
+# is about 200) and --keyframe-interval values to try
+FRAME_SIZE_READS = (16, 50, 200, 500)
+FRAME_SIZE_KEYFRAMES = (8, 32, 128)
+
+
+def legacy_is_erased(fw):
+    """is_erased before the scoring engine, kept for comparison"""
+    set_bits = sum([bin(x).count("1") for x in bytearray(fw)])
+    possible_bits = len(fw) * 8
+    percent = 100.0 * set_bits / possible_bits
+    return set_bits == possible_bits, percent
+
+
+def synth_frame(size, seed=0):
+    """Random frame, roughly half erased"""
+    rng = random.Random(seed)
+    return rng.getrandbits(size * 8).to_bytes(size, "little")
+
+
+def time_call(func, min_time=0.2, max_iters=1000):
+    """Seconds per call, averaged over enough calls to be stable"""
+    iters = 0
+    tstart = time.perf_counter()
+    while True:
+        func()
+        iters += 1
+        dt = time.perf_counter() - tstart
+        if dt >= min_time or iters >= max_iters:
+            return dt / iters
+
+
+def bench_erase(sizes=SIZES, legacy_max=None, min_time=0.2):
+    """Per-frame cost of legacy is_erased vs the scoring engine"""
+    print("%10s %12s %12s %8s" %
+          ("size", "legacy (ms)", "score (ms)", "speedup"))
+    ret = {}
+    for size in sizes:
+        fw = synth_frame(size)
+        # Sanity check the two agree before timing them
+        _erased, legacy_percent = legacy_is_erased(fw)
+        scorej = erase.score(fw)
+        assert abs(scorej["erase_percent"] - legacy_percent) < 1e-9
+
+        t_score = time_call(lambda: collect.score_erase(fw, None),
+                            min_time=min_time)
+        if legacy_max is None or size <= legacy_max:
+            t_legacy = time_call(lambda: legacy_is_erased(fw),
+                                 min_time=min_time)
+            print("%10u %12.3f %12.3f %7.0fx" %
+                  (size, t_legacy * 1e3, t_score * 1e3, t_legacy / t_score))
+        else:
+            t_legacy = None
+            print("%10u %12s %12.3f %8s" % (size, "-", t_score * 1e3, "-"))
+        ret["score/%u" % size] = t_score
+        if t_legacy is not None:
+            ret["legacy/%u" % size] = t_legacy
+    return ret
+
+
+# Command line tools whose startup time matters
+IMPORT_MODULES = ["stats", "csv_runs", "plot"]
+
+
+def time_import(module, runs=5):
+    """Best of runs wall time (sec) to start python and import module"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _i in range(runs):
+        tstart = time.perf_counter()
+        subprocess.check_call(
+            [sys.executable, "-c", "import %s" % module], cwd=here)
+        dt = time.perf_counter() - tstart
+        if best is None or dt < best:
+            best = dt
+    return best
+
+
+def bench_import(modules=IMPORT_MODULES, runs=5):
+    """Import time of each module, less bare interpreter startup"""
+    baseline = time_import("sys", runs=runs)
+    print("%10s %12s" % ("module", "import (ms)"))
+    print("%10s %12.1f" % ("(python)", baseline * 1e3))
+    ret = {}
+    for module in modules:
+        dt = time_import(module, runs=runs) - baseline
+        print("%10s %12.1f" % (module, dt * 1e3))
+        ret["import/%s" % module] = dt
+    return ret
+
+
+def bench_frames(sizes=SIZES, min_time=0.2):
+    """Per-frame cost of the other per read work in collect"""
+    print("%10s %12s %12s %12s %12s" %
+          ("size", "is_erased", "fw2str", "str2fw", "hash8"))
+    ret = {}
+    for size in sizes:
+        fw = synth_frame(size)
+        s = frames.fw2str(fw)
+        row = {
+            "is_erased": lambda: collect.is_erased(fw, None),
+            "fw2str": lambda: frames.fw2str(fw),
+            "str2fw": lambda: frames.str2fw(s),
+            "hash8": lambda: collect.hash8(fw),
+        }
+        for name, func in row.items():
+            ret["%s/%u" % (name, size)] = time_call(func, min_time=min_time)
+        print("%10u %s" % (size, " ".join("%9.3f ms" %
+                                          (ret["%s/%u" % (name, size)] * 1e3)
+                                          for name in row)))
+    return ret
+
+
+def erase_frames(eprom, reads):
+    """Frames read over one erase, same curve as synth_run()"""
+    t50 = reads / 2
+    scale = reads / 24
+    for iter in range(1, reads + 1):
+        yield eprom.frame(1.0 / (1.0 + math.exp(-(iter - t50) / scale)))
+
+
+def bench_frame_size(size=32768, reads=FRAME_SIZE_READS):
+    """
+    Raw / stored frame bytes (footer frame_ratio) per --frames layout
+    XOR deltas only pay off when consecutive reads differ by few bits, so
+    with enough reads over the erase
+    Sizes, not times: printed only, not in the results
+    """
+    layouts = [("jl", frames.DEFAULT_KEYFRAME_INTERVAL)]
+    layouts += [("delta", k) for k in FRAME_SIZE_KEYFRAMES]
+    names = [fmt if fmt == "jl" else "delta/%u" % k for fmt, k in layouts]
+    print("%8s %s" % ("reads", " ".join("%10s" % name for name in names)))
+    eprom = SynthEprom(size)
+    for this_reads in reads:
+        fws = list(erase_frames(eprom, this_reads))
+        ratios = []
+        for fmt, keyframe_interval in layouts:
+            encoder = frames.new_encoder(fmt,
+                                         None,
+                                         size,
+                                         keyframe_interval=keyframe_interval)
+            for fw in fws:
+                encoder.encode(fw)
+            ratios.append(encoder.footer()["frame_ratio"])
+        print("%8u %s" % (this_reads, " ".join("%9.1fx" % ratio
+                                               for ratio in ratios)))
+    return {}
+
+
+class SynthEprom:
+    """
+    Cheap stand-in for an erasing EPROM (see fake_minipro.py for a real one)
+    Each bit gets a random 8 bit erase threshold
+    """
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        rng = random.Random(seed)
+        self.planes = [rng.randbytes(size) for _biti in range(8)]
+
+    def frame(self, fraction):
+        """Frame with about fraction of its bits erased"""
+        level = int(fraction * 256 + 0.5)
+        ret = 0
+        for biti, plane in enumerate(self.planes):
+            table = bytes((1 << biti) if v < level else 0 for v in range(256))
+            ret |= int.from_bytes(plane.translate(table), "little")
+        return ret.to_bytes(self.size, "little")
+
+
+def synth_run(fn,
+              size,
+              reads,
+              seed=0,
+              sn="BENCH",
+              bulb="2",
+              interval=3.0,
+              frame_format="jl"):
+    """
+    Write a .jl like collect.py would for a part erasing over reads reads
+    50% at half way, 100% by 5/6 so the tail is 20% of the run
+    """
+    eprom = SynthEprom(size, seed=seed)
+    encoder = frames.new_encoder(frame_format, fn, size)
+    t50 = reads / 2
+    t100 = None
+    with open(fn, "w") as fout:
+        j = {
+            "type": "header",
+            "prog": "minipro",
+            "prog_dev": "BENCH_%u" % size,
+            "datetime": "2022-01-01T00:00:00",
+            "interval": interval,
+            "erased_threshold": 20.0,
+            "user": "bench",
+            "sn": sn,
+            "eraser": "pe140t",
+            "bulb": bulb,
+        }
+        j.update(encoder.header())
+        j.update(encoder.encode(eprom.frame(0.0), standalone=True))
+        fout.write(json.dumps(j) + "\n")
+        for iter, fw in enumerate(erase_frames(eprom, reads), 1):
+            scorej = erase.score(fw)
+            seconds = (iter - 1) * interval
+            if scorej["erased"] and t100 is None:
+                t100 = seconds
+            j = {"type": "read", "iter": iter, "seconds": seconds}
+            j.update(encoder.encode(fw))
+            j.update({
+                "complete_percent": 0.0,
+                "erase_percent": scorej["erase_percent"],
+                "erased": scorej["erased"],
+            })
+            fout.write(json.dumps(j) + "\n")
+        j = {
+            "type": "footer",
+            "erase_time": t100,
+            "run_time": (reads - 1) * interval,
+            "half_erase_time": (t50 - 1) * interval,
+        }
+        j.update(encoder.footer())
+        fout.write(json.dumps(j) + "\n")
+    encoder.close()
+
+
+def run_fn(corpus, size, reads):
+    return os.path.join(corpus, "runs", "%u_%u" % (size, reads), "iter_01.jl")
+
+
+def synth_corpus(corpus, runs=RUNS):
+    """
+    Build (once) the synthetic runs under corpus:
+        runs/<size>_<reads>/iter_01.jl: load / analysis timing
+        prod/<sn>/bulb-<bulb>/iter_NN.jl + sns.csv: csv_runs timing
+    """
+    tstart = time.perf_counter()
+    for size, reads in runs:
+        fn = run_fn(corpus, size, reads)
+        if not os.path.exists(fn):
+            print("Generating %s" % fn)
+            os.makedirs(os.path.dirname(fn), exist_ok=True)
+            synth_run(fn + ".tmp", size, reads)
+            os.replace(fn + ".tmp", fn)
+    sns_fn = os.path.join(corpus, "sns.csv")
+    if not os.path.exists(sns_fn):
+        print("Generating %s" % os.path.join(corpus, "prod"))
+        size, reads = CORPUS_RUN
+        seed = 0
+        for sni in range(CORPUS_SNS):
+            sn = "BENCH%02u" % sni
+            for bulb in CORPUS_BULBS:
+                d = os.path.join(corpus, "prod", sn, "bulb-%s" % bulb)
+                os.makedirs(d, exist_ok=True)
+                for passn in range(1, CORPUS_PASSES + 1):
+                    seed += 1
+                    synth_run(os.path.join(d, "iter_%02u.jl" % passn),
+                              size,
+                              reads,
+                              seed=seed,
+                              sn=sn,
+                              bulb=bulb)
+        with open(sns_fn + ".tmp", "w") as f:
+            f.write("sn,vendor,model\n")
+            for sni in range(CORPUS_SNS):
+                f.write("BENCH%02u,Bench,27C%03u\n" % (sni, sni))
+        os.replace(sns_fn + ".tmp", sns_fn)
+    print("Corpus ready in %0.1f sec" % (time.perf_counter() - tstart))
+
+
+def time_quiet(func, min_time=0.2):
+    """time_call() w/ func's prints discarded"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return time_call(func, min_time=min_time, max_iters=100)
+
+
+def bench_analysis(corpus, runs=RUNS, min_time=0.2):
+    """.jl loading and the analysis scripts over a synthetic corpus"""
+    import eetime.jl
+    import stats
+    import csv_runs
+    import csv_aggregate
+
+    synth_corpus(corpus, runs=runs)
+    ret = {}
+    print("%10s %8s %12s %12s %12s" %
+          ("size", "reads", "load_jl", "curve", "stats.run"))
+    for size, reads in runs:
+        fn = run_fn(corpus, size, reads)
+        key = "%u_%u" % (size, reads)
+        ret["load_jl/" + key] = time_quiet(lambda: eetime.jl.load_jl(fn),
+                                           min_time=min_time)
+        ret["load_jls_arg/" + key] = time_quiet(lambda: list(
+            eetime.jl.load_jls_arg([fn], fields=eetime.jl.CURVE_FIELDS)),
+                                                min_time=min_time)
+        ret["stats.run/" + key] = time_quiet(lambda: stats.run([fn]),
+                                             min_time=min_time)
+        print(
+            "%10u %8u %9.1f ms %9.1f ms %9.1f ms" %
+            (size, reads, ret["load_jl/" + key] * 1e3,
+             ret["load_jls_arg/" + key] * 1e3, ret["stats.run/" + key] * 1e3))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs_csv = os.path.join(tmp, "runs.csv")
+        ret["csv_runs.run"] = time_quiet(
+            lambda: csv_runs.run(os.path.join(corpus, "prod"),
+                                 runs_csv,
+                                 sns_fn=os.path.join(corpus, "sns.csv")),
+            min_time=min_time)
+        ret["csv_aggregate.run"] = time_quiet(lambda: csv_aggregate.run(
+            runs_csv, os.path.join(tmp, "aggregate.csv")),
+                                              min_time=min_time)
+    print("csv_runs.run: %0.1f ms (%u runs)" %
+          (ret["csv_runs.run"] * 1e3,
+           CORPUS_SNS * len(CORPUS_BULBS) * CORPUS_PASSES))
+    print("csv_aggregate.run: %0.1f ms" % (ret["csv_aggregate.run"] * 1e3, ))
+
+    from eetime import fit
+    curves = [
+        stats.load_curve(run_fn(corpus, size, reads)) for size, reads in runs
+    ]
+    curves = (curves * FIT_RUNS)[:FIT_RUNS]
+    ret["fit.fit_runs"] = time_quiet(lambda: fit.fit_runs(curves),
+                                     min_time=min_time)
+    print("fit.fit_runs: %0.1f ms (%u runs)" %
+          (ret["fit.fit_runs"] * 1e3, FIT_RUNS))
+    return ret
+
+
+def check_regressions(results, baseline, threshold):
+    """
+    Names of results more than threshold (ex: 0.2 = 20%) slower than baseline
+    Only results in both are compared
+    """
+    ret = []
+    print("")
+    print("%-28s %12s %12s %8s" % ("benchmark", "baseline", "now", "change"))
+    for name, t in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            continue
+        change = t / base - 1.0
+        regressed = change > threshold
+        print("%-28s %9.3f ms %9.3f ms %+7.0f%%%s" %
+              (name, base * 1e3, t * 1e3, change * 100,
+               " REGRESSION" if regressed else ""))
+        if regressed:
+            ret.append(name)
+    return ret
+
+
+BENCHMARKS = ("erase", "import", "frames", "frame_size", "analysis")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark collection and analysis hot paths")
+    parser.add_argument(
+        '--legacy-max',
+        type=int,
+        default=None,
+        help='erase: skip legacy timing above this size (bytes)')
+    parser.add_argument('--min-time',
+                        type=float,
+                        default=0.2,
+                        help='Minimum seconds to time each entry')
+    parser.add_argument('--runs',
+                        type=int,
+                        default=5,
+                        help='import: best of this many interpreter starts')
+    parser.add_argument('--max-size',
+                        type=int,
+                        default=None,
+                        help='Skip devices larger than this (bytes)')
+    parser.add_argument(
+        '--corpus',
+        default=None,
+        help='analysis: keep synthetic runs here (default: temp dir)')
+    parser.add_argument('--json', default=None, help='Write results here')
+    parser.add_argument('--compare',
+                        default=None,
+                        help='Baseline --json to check for regressions')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.2,
+        help='--compare: fail if this much slower (0.2 = 20%%)')
+    parser.add_argument('benchmarks',
+                        nargs="*",
+                        help='Benchmarks to run: %s (default: all)' %
+                        ", ".join(BENCHMARKS))
+    args = parser.parse_args()
+
+    benchmarks = args.benchmarks or BENCHMARKS
+    for benchmark in benchmarks:
+        if benchmark not in BENCHMARKS:
+            parser.error("Unknown benchmark %s" % benchmark)
+    sizes = [
+        size for size in SIZES
+        if args.max_size is None or size <= args.max_size
+    ]
+    runs = [
+        run for run in RUNS if args.max_size is None or run[0] <= args.max_size
+    ]
+
+    results = {}
+    if "erase" in benchmarks:
+        results.update(
+            bench_erase(sizes=sizes,
+                        legacy_max=args.legacy_max,
+                        min_time=args.min_time))
+    if "import" in benchmarks:
+        results.update(bench_import(runs=args.runs))
+    if "frames" in benchmarks:
+        results.update(bench_frames(sizes=sizes, min_time=args.min_time))
+    if "frame_size" in benchmarks:
+        results.update(bench_frame_size(size=min(32768, max(sizes))))
+    if "analysis" in benchmarks:
+        if args.corpus:
+            results.update(
+                bench_analysis(args.corpus, runs=runs, min_time=args.min_time))
+        else:
+            with tempfile.TemporaryDirectory() as corpus:
+                results.update(
+                    bench_analysis(corpus, runs=runs, min_time=args.min_time))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "datetime": collect.tnow(),
+                    "results": results,
+                },
+                f,
+                indent=4,
+                sort_keys=True)
+        print("Wrote %s" % args.json)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = check_regressions(results, baseline, args.threshold)
+        if regressions:
+            print("FAIL: %u regressions" % len(regressions))
+            sys.exit(1)
+        print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,8 +10,6 @@ import eetime.jl
 from eetime import util
 import glob
 import os
-import binascii
-import collect
 
 
 def main():
@@ -34,9 +32,9 @@ def main():
 
     print("Opening %s" % (fn, ))
     header, _footer, _reads = eetime.jl.load_jl(fn)
-    if not "read" in header:
+    buf = eetime.jl.decode_frame(fn, header, header)
+    if buf is None:
         raise Exception(".jl doesn't support initial read")
-    buf = collect.str2fw(header["read"])
     if args.hexdump:
         util.hexdump(buf, terse=True)
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Per bit erase times (see eetime.bits)
+
+Writes iter_NN.bits.npy next to each .jl (once) and summarizes the spread
+of erase times, including bit to bit variation across passes
+"""
+
+import argparse
+import numpy as np
+import eetime.jl
+from eetime import bits
+
+
+def summarize(fn, iters, seconds):
+    n = len(iters)
+    at_init = int((iters == 0).sum())
+    never = int((iters == bits.NEVER).sum())
+    erased = seconds[(iters != 0) & (iters != bits.NEVER)]
+    print("%s" % fn)
+    print("  bits: %u, erased at init: %u, never erased: %u" %
+          (n, at_init, never))
+    if len(erased):
+        ps = np.percentile(erased, [1, 10, 50, 90, 99])
+        print("  erase time p1 / p10 / p50 / p90 / p99: %s sec" %
+              " / ".join("%0.1f" % p for p in ps))
+
+
+def compare_passes(fns, all_seconds):
+    """Bit to bit variation of erase time across passes"""
+    sizes = set(len(seconds) for seconds in all_seconds)
+    if len(sizes) != 1:
+        print("Passes have different sizes, not comparing")
+        return
+    stack = np.vstack(all_seconds)
+    # Only bits that were programmed and erased in every pass
+    ok = np.all(np.isfinite(stack) & (stack > 0), axis=0)
+    stack = stack[:, ok]
+    print("")
+    print("Across %u passes (%u bits erased in all)" % (len(fns), ok.sum()))
+    if not ok.any():
+        return
+    std = stack.std(axis=0)
+    print("  per bit stddev: mean %0.2f sec, max %0.2f sec" %
+          (std.mean(), std.max()))
+    if len(fns) > 1:
+        corr = np.corrcoef(stack)
+        off = corr[~np.eye(len(fns), dtype=bool)]
+        print("  pass to pass correlation: min %0.3f, mean %0.3f" %
+              (off.min(), off.mean()))
+
+
+def plot(fns, all_seconds, row_bytes, save=None):
+    import matplotlib.pyplot as plt
+
+    fig, (ax_hist, ax_map) = plt.subplots(2, 1)
+    for fn, seconds in zip(fns, all_seconds):
+        ax_hist.hist(seconds[np.isfinite(seconds) & (seconds > 0)],
+                     bins=100,
+                     histtype="step",
+                     label=fn)
+    ax_hist.set_xlabel("erase time (sec)")
+    ax_hist.set_ylabel("bits")
+    ax_hist.legend()
+
+    # Mean erase time per byte, row_bytes bytes per row
+    byte_seconds = np.nanmean(all_seconds[0].reshape(-1, 8), axis=1)
+    rows = len(byte_seconds) // row_bytes
+    im = ax_map.imshow(byte_seconds[:rows * row_bytes].reshape(
+        rows, row_bytes),
+                       aspect="auto",
+                       interpolation="nearest")
+    ax_map.set_xlabel("byte")
+    ax_map.set_ylabel("address / %u" % row_bytes)
+    fig.colorbar(im, ax=ax_map, label="mean erase time (sec)")
+
+    if save:
+        plt.savefig(save)
+    else:
+        plt.show()
+
+
+def run(jls, rebuild=False):
+    """Returns (fns, per bit seconds for each)"""
+    fns = []
+    all_seconds = []
+    for fn in eetime.jl.expand_jls_arg(jls):
+        _header, _footer, reads = eetime.jl.load_jl(fn,
+                                                    fields=("iter", "seconds"))
+        iters = bits.load_bit_map(fn, rebuild=rebuild)
+        seconds = bits.bit_seconds(iters, reads)
+        summarize(fn, iters, seconds)
+        fns.append(fn)
+        all_seconds.append(seconds)
+    if len(fns) > 1:
+        compare_passes(fns, all_seconds)
+    return fns, all_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per bit erase times')
+    parser.add_argument('--rebuild',
+                        action="store_true",
+                        help='Recompute .bits.npy even if up to date')
+    parser.add_argument('--plot',
+                        action="store_true",
+                        help='Histogram and per address heatmap')
+    parser.add_argument('--row-bytes',
+                        type=int,
+                        default=256,
+                        help='--plot: heatmap bytes per row')
+    parser.add_argument('--save', default=None, help='--plot: save to file')
+    parser.add_argument('jls', nargs="+", help='.jl files or directories')
+    args = parser.parse_args()
+
+    fns, all_seconds = run(args.jls, rebuild=args.rebuild)
+    if args.plot and fns:
+        plot(fns, all_seconds, args.row_bytes, save=args.save)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,27 @@
 
 from eetime.minipro import Minipro
 from eetime import util
+from eetime import erase
+from eetime import sched
 import collect
 
 
-def run(prog_dev, loop=False, verbose=False):
+def run(prog_dev, loop=False, interval=0.0, verbose=False):
+    """interval: with loop, seconds between reads (0: back to back)"""
     prog = Minipro(device=prog_dev, verbose=verbose)
 
     def check():
         read_buf = prog.read()["code"]
-        erased, erase_percent = collect.is_erased(read_buf,
-                                                  prog_dev=prog.device)
+        scorej = collect.score_erase(read_buf, prog_dev=prog.device)
 
         print("is_erased %u w/ erase_percent % 8.3f%%" %
-              (erased, erase_percent))
+              (scorej["erased"], scorej["erase_percent"]))
+        print("  regions: %s" % erase.format_regions(scorej))
 
     if loop:
+        frame_lock = sched.FrameLock()
         while True:
+            frame_lock.wait(interval)
             check()
     else:
         check()
@@ -33,6 +38,13 @@ if __name__ == "__main__":
                         help='minipro device. See "minipro -l"')
     util.add_bool_arg(parser, "--verbose", default=False)
     util.add_bool_arg(parser, "--loop", default=False, help="Check forever")
+    parser.add_argument('--interval',
+                        type=float,
+                        default=0.0,
+                        help='--loop: seconds between reads (0: back to back)')
     args = parser.parse_args()
 
-    run(args.device, loop=args.loop, verbose=args.verbose)
+    run(args.device,
+        loop=args.loop,
+        interval=args.interval,
+        verbose=args.verbose)
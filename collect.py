@@ -3,27 +3,33 @@
 from eetime.util import tostr
 from eetime import util
 from eetime.minipro import Minipro
+from eetime import erase
+from eetime import frames
+from eetime import sched
+from eetime import timing as etiming
+from eetime import jl as ejl
+# Historically lived here
+from eetime.frames import fw2str, str2fw
 
-import json
 import datetime
+import glob
 import time
-import zlib
 import binascii
 import hashlib
 import os
+import concurrent.futures
+import threading
 
 
-def popcount(x):
-    return bin(x).count("1")
+def score_erase(fw, prog_dev, regions=erase.DEFAULT_REGIONS):
+    # for now assume all 1's is erased
+    # on some devices like PIC this isn't true due to file 0 padding
+    return erase.score(fw, regions=regions)
 
 
 def is_erased(fw, prog_dev):
-    # for now assume all 1's is erased
-    # on some devices like PIC this isn't true due to file 0 padding
-    set_bits = sum([popcount(x) for x in bytearray(fw)])
-    possible_bits = len(fw) * 8
-    percent = 100.0 * set_bits / possible_bits
-    return set_bits == possible_bits, percent
+    scorej = score_erase(fw, prog_dev)
+    return scorej["erased"], scorej["erase_percent"]
 
 
 def hash8(buf):
@@ -31,28 +37,100 @@ def hash8(buf):
     return tostr(binascii.hexlify(hashlib.md5(buf).digest())[0:8])
 
 
-def fw2str(fw):
-    return tostr(binascii.hexlify(zlib.compress(fw)))
-
-
-def str2fw(s):
-    return zlib.decompress(binascii.unhexlify(s))
-
-
 def tnow():
     return datetime.datetime.utcnow().isoformat()
 
 
 def check_erase(prog):
     read_buf = prog.read()["code"]
-    erased, erase_percent = is_erased(read_buf, prog_dev=prog.device)
+    scorej = score_erase(read_buf, prog_dev=prog.device)
 
     signature = hash8(read_buf)
     print("is_erased %u w/ erase_percent % 8.3f%%, sig %s" %
-          (erased, erase_percent, signature))
+          (scorej["erased"], scorej["erase_percent"], signature))
+    print("  regions: %s" % erase.format_regions(scorej))
+
+
+def read_frames(prog,
+                tstart,
+                schedule,
+                frame_lock,
+                iter=0,
+                timeout=None,
+                reuse=False,
+                stop=None):
+    """
+    Frame locked device reads
+    Yields (iter, tread, read_buf, (start, end)) where start and end bracket
+    the read. All times are time.monotonic()
+    On timeout, yields read_buf None and stops
+
+    schedule: {"interval": seconds}, checked before each read so that the
+        consumer can change the interval
+    frame_lock: eetime.sched.FrameLock that paces the reads
+    iter: last iter already done (resume)
+    reuse: read into the same buffer each time (see Minipro.read)
+    stop: threading.Event to stop reading early
+    """
+    while True:
+        tlast = frame_lock.wait(schedule["interval"], stop=stop)
+        if stop is not None and stop.is_set():
+            return
+        iter += 1
+
+        if timeout and tlast - tstart >= timeout:
+            yield iter, tlast, None, None
+            return
+
+        read_start = time.monotonic()
+        read_buf = prog.read(reuse=reuse)["code"]
+        yield iter, tlast, read_buf, (read_start, time.monotonic())
 
 
-def wait_erased(fout,
+# Read record fields needed to pick up a pass where it left off
+RESUME_FIELDS = ("iter", "seconds", "erase_percent", "erased", "interval")
+
+
+def resume_state(dout, label=""):
+    """
+    Where to pick up an interrupted run in dout
+    Returns (passn, resume). resume is None to start passn from scratch,
+    otherwise the partial pass:
+        header: its header
+        reads: its read records so far (RESUME_FIELDS)
+        elapsed: seconds since the pass started
+    """
+    fns = sorted(glob.glob(os.path.join(dout, "iter_*.jl")))
+    if not fns:
+        return 1, None
+    fn = fns[-1]
+    passn = int(os.path.basename(fn)[len("iter_"):-len(".jl")])
+    dropped = ejl.recover_jl(fn)
+    if dropped:
+        print("%s%s: dropped %u byte torn tail" % (label, fn, dropped))
+    index = ejl.JLIndex(fn, persist=False)
+    try:
+        if index.footer():
+            return passn + 1, None
+        if index.timeout():
+            raise Exception("%s timed out, can't resume" % fn)
+        header = index.header()
+        if not header:
+            return passn, None
+        reads = [
+            index.read(n, fields=RESUME_FIELDS) for n in range(len(index))
+        ]
+    finally:
+        index.close()
+    # Only the wall clock survives a restart
+    started = datetime.datetime.fromisoformat(header["datetime"])
+    elapsed = (datetime.datetime.utcnow() - started).total_seconds()
+    if reads:
+        elapsed = max(elapsed, reads[-1]["seconds"])
+    return passn, {"header": header, "reads": reads, "elapsed": elapsed}
+
+
+def wait_erased(writer,
                 prog,
                 erased_threshold=20.,
                 interval=3.0,
@@ -61,42 +139,145 @@ def wait_erased(fout,
                 need_passes=0,
                 timeout=None,
                 test=False,
+                frame_encoder=None,
+                adaptive=None,
+                pipeline=0,
+                timing=False,
+                resume=None,
+                label="",
                 verbose=False):
     """
+    writer: eetime.jl.JLWriter for the pass
     erased_threshold: stop when this percent contiguous into a successful erase
         Ex: if 99 iterations wasn't fully erased but 100+ was, stop at 120 iterations
     interval: how often, in seconds, to read the device
+    adaptive: eetime.sched.AdaptiveInterval to vary interval with the erase rate
+        Completion is then judged on time instead of iterations
+    frame_encoder: how to store reads (see eetime.frames). Default inline zlib
+    pipeline: if > 0, read the device in a thread and queue up to this many
+        reads for scoring, compression and logging
+    timing: add read timestamps and per stage durations to each read record
+        and a summary to the footer (see eetime.timing)
+    resume: continue an interrupted pass (see resume_state())
+    label: prefix for console output (ex: which station)
     """
+    if frame_encoder is None:
+        frame_encoder = frames.ZlibEncoder()
+
+    # Monotonic so clock adjustments (ex: NTP) don't skew timing
+    tstart = time.monotonic()
+    prior = []
+    if resume:
+        tstart -= resume["elapsed"]
+        prior = resume["reads"]
+    timer = None
+    if timing:
+        timer = etiming.ReadTimer(tstart)
+    if adaptive:
+        # Differs from interval when resuming
+        interval = adaptive.interval
+    schedule = {"interval": interval}
+    # Adaptive intervals are expected to be shorter than a read at times
+    frame_lock = sched.FrameLock(label=label, log=not adaptive)
+    stop = threading.Event()
+    # Pipelined reads are still queued while we process so can't be reused
+    reads = read_frames(prog,
+                        tstart,
+                        schedule,
+                        frame_lock,
+                        iter=prior[-1]["iter"] if prior else 0,
+                        timeout=timeout,
+                        reuse=not pipeline,
+                        stop=stop)
+    if pipeline:
+        reads = sched.PipelinedReader(reads, pipeline, stop, label=label)
+    try:
+        dt_100, dt_50, tlast = _process_reads(
+            writer,
+            reads,
+            prog,
+            tstart,
+            schedule,
+            erased_threshold=erased_threshold,
+            passn=passn,
+            need_passes=need_passes,
+            test=test,
+            frame_encoder=frame_encoder,
+            adaptive=adaptive,
+            timer=timer,
+            prior=prior,
+            label=label)
+    finally:
+        if pipeline:
+            reads.close()
 
-    tstart = time.time()
-    # Last iteration timestamp. Used to "frame lock" reads at set interval
-    tlast = None
+    dt_120 = tlast - tstart
+    print("%sErased 100%% after %0.1f sec" % (label, dt_100))
+    print("%sErased 120%% after %0.1f sec" % (label, dt_120))
+    frame_stats = frame_encoder.footer()
+    if "frame_ratio" in frame_stats:
+        print("%sFrames stored at %0.1fx compression" %
+              (label, frame_stats["frame_ratio"]))
+    if timer:
+        timer.print_summary(label)
+
+    j = {
+        "type": "footer",
+        "erase_time": dt_100,
+        "run_time": dt_120,
+        "half_erase_time": dt_50
+    }
+    if prog_time is not None:
+        j["prog_time"] = prog_time
+    j.update(frame_stats)
+    j.update(frame_lock.footer())
+    if pipeline:
+        j.update(reads.footer())
+    if timer:
+        j.update(timer.footer())
+    writer.write(j, sync=True)
+    return dt_100, dt_50
+
+
+def _process_reads(writer, reads, prog, tstart, schedule, erased_threshold,
+                   passn, need_passes, test, frame_encoder, adaptive, timer,
+                   prior, label):
+    """
+    wait_erased() worker: score, store and report each read until erased
+    prior: read records already in the pass (resume)
+    Returns dt_100, dt_50, tlast
+    """
     # Timestamp when EPROM was first half erased
     dt_50 = None
     dt_100 = None
-    iter = 0
     nerased = 0
-    while True:
-        if tlast is not None:
-            while time.time() - tlast < interval:
-                time.sleep(0.1)
-
-        tlast = time.time()
+    for j in prior:
+        if j["erased"] or test:
+            nerased += 1
+            if not dt_100:
+                dt_100 = j["seconds"]
+        else:
+            nerased = 0
+            dt_100 = None
+        if dt_50 is None and j["erase_percent"] >= 50:
+            dt_50 = j["seconds"]
+    for iter, tlast, read_buf, read_times in reads:
         dt_this = tlast - tstart
-        iter += 1
-
-        if timeout and dt_this >= timeout:
+        if read_buf is None:
             j = {
                 "type": "timeout",
                 'iter': iter,
                 'seconds': dt_this,
             }
-            fout.write(json.dumps(j) + '\n')
-            fout.flush()
+            writer.write(j, sync=True)
             raise Exception("Timed out")
 
-        read_buf = prog.read()["code"]
-        erased, erase_percent = is_erased(read_buf, prog_dev=prog.device)
+        tstage = time.monotonic()
+        scorej = score_erase(read_buf, prog_dev=prog.device)
+        if timer:
+            timer.stage("score", time.monotonic() - tstage)
+        erased = scorej["erased"]
+        erase_percent = scorej["erase_percent"]
         if erased or test:
             nerased += 1
             if not dt_100:
@@ -105,7 +286,13 @@ def wait_erased(fout,
             nerased = 0
             dt_100 = None
         # Declare done when we've been erased for some percentage of elapsed time
-        complete_percent = 100.0 * nerased / iter
+        if adaptive:
+            # Iterations no longer map to time
+            complete_percent = 0.0
+            if nerased and dt_this:
+                complete_percent = 100.0 * (dt_this - dt_100) / dt_this
+        else:
+            complete_percent = 100.0 * nerased / iter
         # Convert to more human friendly 100% scale
         end_check = 100. * complete_percent / erased_threshold
 
@@ -113,19 +300,38 @@ def wait_erased(fout,
             "type": "read",
             'iter': iter,
             'seconds': dt_this,
-            'read': fw2str(read_buf),
-            'read_meta': "zlib",
+        }
+        tstage = time.monotonic()
+        j.update(frame_encoder.encode(read_buf))
+        if timer:
+            timer.stage("encode", time.monotonic() - tstage)
+        j.update({
             'complete_percent': complete_percent,
             'erase_percent': erase_percent,
             'erased': erased
-        }
-        fout.write(json.dumps(j) + '\n')
-        fout.flush()
-
+        })
+        if timer:
+            j.update(timer.read(*read_times, schedule["interval"]))
+        if adaptive:
+            # Nominal time since the previous read
+            j['interval'] = schedule["interval"]
+            schedule["interval"] = adaptive.next(dt_this, erase_percent)
+
+        tstage = time.monotonic()
         signature = hash8(read_buf)
+        if timer:
+            timer.stage("hash", time.monotonic() - tstage)
+            j.update(timer.stages(("score", "encode", "hash")))
+
+        tstage = time.monotonic()
+        writer.write(j)
+        if timer:
+            timer.stage("write", time.monotonic() - tstage)
+
         print(
-            "pass %u / %u, iter % 3u @ %s: is_erased %u w/ erase_percent % 8.3f%%, sig %s, end_check: %0.1f%%"
+            "%spass %u / %u, iter % 3u @ %s: is_erased %u w/ erase_percent % 8.3f%%, sig %s, end_check: %0.1f%%"
             % (
+                label,
                 passn,
                 need_passes,
                 iter,
@@ -137,24 +343,9 @@ def wait_erased(fout,
                 end_check))
         if dt_50 is None and erase_percent >= 50 or test:
             dt_50 = tlast - tstart
-            print("50%% erased after %0.1f sec" % (dt_50, ))
+            print("%s50%% erased after %0.1f sec" % (label, dt_50))
         if end_check >= 100.0 or test:
-            break
-    dt_120 = tlast - tstart
-    print("Erased 100%% after %0.1f sec" % (dt_100, ))
-    print("Erased 120%% after %0.1f sec" % (dt_120, ))
-
-    j = {
-        "type": "footer",
-        "erase_time": dt_100,
-        "run_time": dt_120,
-        "half_erase_time": dt_50
-    }
-    if prog_time is not None:
-        j["prog_time"] = prog_time
-    fout.write(json.dumps(j) + '\n')
-    fout.flush()
-    return dt_100, dt_50
+            return dt_100, dt_50, tlast
 
 
 def run(dout,
@@ -170,7 +361,37 @@ def run(dout,
         sn=None,
         test=False,
         timeout=None,
+        frame_format="jl",
+        keyframe_interval=frames.DEFAULT_KEYFRAME_INTERVAL,
+        interval_min=None,
+        interval_max=None,
+        adapt_step=sched.DEFAULT_ADAPT_STEP,
+        pipeline=0,
+        timing=False,
+        sync_records=ejl.DEFAULT_SYNC_RECORDS,
+        sync_interval=ejl.DEFAULT_SYNC_INTERVAL,
+        resume=False,
+        minipro=None,
+        minipro_stdout=False,
+        label="",
         verbose=False):
+    """
+    frame_format: how to store reads
+        jl: inline, each read compressed on its own
+        bin: binary sidecar
+        delta: inline, compressed XOR vs previous read
+    keyframe_interval: delta only, store a full read this often
+    interval_max: if given, vary the read interval between interval_min
+        and interval_max, aiming for adapt_step erase_percent per read
+    pipeline: read in a background thread, queueing up to this many reads
+    timing: record where the time goes in each read (see wait_erased)
+    sync_records, sync_interval: fsync the log every this many records or
+        seconds (see eetime.jl.JLWriter)
+    resume: continue where a previous run in dout stopped
+    minipro: minipro executable for this programmer (default: $MINIPRO)
+    minipro_stdout: have minipro send reads to stdout instead of a file
+    label: prefix for console output (ex: which station)
+    """
     if passes > 1 and not write_init:
         raise Exception("Must --write-init if > 1 pass")
 
@@ -178,67 +399,195 @@ def run(dout,
         os.makedirs(dout, exist_ok=True)
 
     print("")
-    prog = Minipro(device=prog_dev, verbose=verbose)
-    print("Checking programmer...")
-    size = len(prog.read()["code"])
-    print("Device is %u bytes" % size)
-    # Write 0's at the beginning of every pass
-    init_buf = bytearray(size)
-
-    for passn in range(passes):
+    with Minipro(device=prog_dev,
+                 verbose=verbose,
+                 path=minipro,
+                 stdout=minipro_stdout) as prog:
+        print("%sChecking programmer..." % label)
+        size = len(prog.read()["code"])
+        print("%sDevice is %u bytes" % (label, size))
+        # Write 0's at the beginning of every pass
+        init_buf = bytearray(size)
+
+        start_pass = 1
+        resume_pass = None
+        if resume:
+            start_pass, resume_pass = resume_state(dout, label=label)
+            if start_pass > passes:
+                print("%sAll %u passes already done" % (label, passes))
+
         # 1 based indexing. At least make it match iter
-        passn += 1
-        fnout = '%s/iter_%02u.jl' % (dout, passn)
-        print('')
-        print('Writing to %s' % fnout)
-        read_init_buf = None
-        if read_init:
-            print('Reading initial state')
-            read_init_buf = prog.read()["code"]
-
-        if write_init:
-            print('Writing initial buffer...')
-            tstart = time.time()
-            prog.write(init_buf, verify=False)
-            prog_time = time.time() - tstart
-            print('Wrote in %0.1f sec' % prog_time)
-        else:
-            prog_time = None
+        for passn in range(start_pass, passes + 1):
+            fnout = '%s/iter_%02u.jl' % (dout, passn)
+            print('')
+            if resume_pass:
+                header = resume_pass["header"]
+                reads = resume_pass["reads"]
+                print('%sResuming %s at iter %u, %0.1f sec in' %
+                      (label, fnout, reads[-1]["iter"] if reads else 0,
+                       resume_pass["elapsed"]))
+                # Settings from the original run win
+                pass_interval = header["interval"]
+                pass_threshold = header["erased_threshold"]
+                prog_time = None
+                pass_keyframes = header.get("keyframe_interval",
+                                            keyframe_interval)
+                frame_encoder = frames.new_encoder(
+                    frames.header_format(header),
+                    fnout,
+                    size,
+                    keyframe_interval=pass_keyframes,
+                    mode="a")
+                adaptive = None
+                if "interval_max" in header:
+                    adaptive = sched.AdaptiveInterval(
+                        header["interval_min"],
+                        header["interval_max"],
+                        start=reads[-1].get("interval", pass_interval)
+                        if reads else pass_interval,
+                        step=header["adapt_step"])
+                    # Replay the last step to get back to the same interval
+                    for j in reads[-2:]:
+                        adaptive.next(j["seconds"], j["erase_percent"])
+                writer = ejl.JLWriter(fnout,
+                                      "a",
+                                      sync_records=sync_records,
+                                      sync_interval=sync_interval,
+                                      before_sync=frame_encoder.sync)
+            else:
+                print('%sWriting to %s' % (label, fnout))
+                pass_interval = interval
+                pass_threshold = erased_threshold
+                read_init_buf = None
+                if read_init:
+                    print('%sReading initial state' % label)
+                    read_init_buf = prog.read()["code"]
+
+                if write_init:
+                    print('%sWriting initial buffer...' % label)
+                    tstart = time.monotonic()
+                    prog.write(init_buf, verify=False)
+                    prog_time = time.monotonic() - tstart
+                    print('%sWrote in %0.1f sec' % (label, prog_time))
+                else:
+                    prog_time = None
+
+                frame_encoder = frames.new_encoder(
+                    frame_format,
+                    fnout,
+                    size,
+                    keyframe_interval=keyframe_interval)
+                adaptive = None
+                if interval_max is not None:
+                    adaptive = sched.AdaptiveInterval(interval_min or 0.0,
+                                                      interval_max,
+                                                      start=interval,
+                                                      step=adapt_step)
+                writer = ejl.JLWriter(fnout,
+                                      "w",
+                                      sync_records=sync_records,
+                                      sync_interval=sync_interval,
+                                      before_sync=frame_encoder.sync)
+                j = {
+                    "type": "header",
+                    "prog": "minipro",
+                    "prog_dev": prog.device,
+                    "datetime": tnow(),
+                    "interval": interval,
+                    "erased_threshold": erased_threshold,
+                }
+                if test:
+                    j['test'] = bool(test)
+                if write_init:
+                    # Any init read was taken before the chip was written
+                    j['write_init'] = True
+                if user:
+                    j['user'] = user
+                if sn:
+                    j['sn'] = sn
+                if eraser:
+                    j['eraser'] = eraser
+                if bulb:
+                    j['bulb'] = bulb
+                if adaptive:
+                    j.update(adaptive.header())
+                j.update(frame_encoder.header())
+                if read_init_buf:
+                    j.update(
+                        frame_encoder.encode(read_init_buf, standalone=True))
+                writer.write(j, sync=True)
+
+            try:
+                wait_erased(writer,
+                            prog=prog,
+                            erased_threshold=pass_threshold,
+                            interval=pass_interval,
+                            prog_time=prog_time,
+                            passn=passn,
+                            need_passes=passes,
+                            timeout=timeout,
+                            test=test,
+                            frame_encoder=frame_encoder,
+                            adaptive=adaptive,
+                            pipeline=pipeline,
+                            timing=timing,
+                            resume=resume_pass,
+                            label=label,
+                            verbose=verbose)
+            finally:
+                writer.close()
+                frame_encoder.close()
+            resume_pass = None
+
+
+def parse_station(s):
+    """DEVICE,SN[,MINIPRO] => dict"""
+    parts = s.split(",")
+    if len(parts) not in (2, 3) or not parts[0] or not parts[1]:
+        raise ValueError("Expected DEVICE,SN[,MINIPRO], got %s" % (s, ))
+    return {
+        "device": parts[0],
+        "sn": parts[1],
+        "minipro": parts[2] if len(parts) == 3 else None,
+    }
 
-        with open(fnout, "w") as fout:
-            j = {
-                "type": "header",
-                "prog": "minipro",
-                "prog_dev": prog.device,
-                "datetime": tnow(),
-                "interval": interval,
-                "erased_threshold": erased_threshold,
-            }
-            if test:
-                j['test'] = bool(test)
-            if user:
-                j['user'] = user
-            if sn:
-                j['sn'] = sn
-            if eraser:
-                j['eraser'] = eraser
-            if bulb:
-                j['bulb'] = bulb
-            if read_init_buf:
-                j['read'] = fw2str(read_init_buf)
-            fout.write(json.dumps(j) + '\n')
-            fout.flush()
-
-            wait_erased(fout,
-                        prog=prog,
-                        erased_threshold=erased_threshold,
-                        interval=interval,
-                        prog_time=prog_time,
-                        passn=passn,
-                        need_passes=passes,
-                        timeout=timeout,
-                        test=test,
-                        verbose=verbose)
+
+def run_stations(dout, stations, **kwargs):
+    """
+    Collect from several programmers at once
+    Each station runs run() in its own thread, so each one keeps its own
+    frame locked read schedule regardless of how slow the others are
+    Output for a station goes to dout/<sn>/iter_NN.jl
+
+    stations: list of parse_station() dicts
+    kwargs: passed to run()
+    """
+    sns = [station["sn"] for station in stations]
+    if len(set(sns)) != len(sns):
+        raise ValueError("Station S/Ns must be unique")
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(stations)) as executor:
+        futures = {}
+        for station in stations:
+            future = executor.submit(run,
+                                     os.path.join(dout, station["sn"]),
+                                     station["device"],
+                                     sn=station["sn"],
+                                     minipro=station["minipro"],
+                                     label="%s: " % station["sn"],
+                                     **kwargs)
+            futures[future] = station
+        failed = []
+        for future in concurrent.futures.as_completed(futures):
+            station = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print("%s: failed: %s" % (station["sn"], e))
+                failed.append(station["sn"])
+    if failed:
+        raise Exception("Station(s) failed: %s" % ", ".join(failed))
 
 
 if __name__ == "__main__":
@@ -247,8 +596,15 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Collect data on EPROM erasure time")
     parser.add_argument('--device',
-                        required=True,
+                        default=None,
                         help='minipro device. See "minipro -l"')
+    parser.add_argument(
+        '--station',
+        action="append",
+        default=[],
+        help='DEVICE,SN[,MINIPRO]: collect from one programmer per --station '
+        'into <dir>/<SN>/ instead of --device. MINIPRO: minipro executable '
+        'for this station (default: $MINIPRO / minipro)')
     parser.add_argument(
         '--passes',
         type=int,
@@ -263,6 +619,25 @@ if __name__ == "__main__":
                         type=float,
                         default=3.0,
                         help='Erase check interval (seconds)')
+    parser.add_argument(
+        '--interval-max',
+        type=float,
+        default=None,
+        help='Adapt the interval to the erase rate, up to this (seconds)')
+    parser.add_argument('--interval-min',
+                        type=float,
+                        default=0.0,
+                        help='Adaptive interval lower bound (seconds)')
+    parser.add_argument(
+        '--adapt-step',
+        type=float,
+        default=sched.DEFAULT_ADAPT_STEP,
+        help='Adaptive interval: target erase percent change per read')
+    parser.add_argument(
+        '--pipeline',
+        type=int,
+        default=0,
+        help='Read in a thread, queueing up to this many reads (0: off)')
     parser.add_argument('--timeout',
                         type=float,
                         default=60 * 60,
@@ -281,6 +656,15 @@ if __name__ == "__main__":
         '--postfix',
         default=None,
         help='Use default output dir, but add description postfix')
+    parser.add_argument(
+        '--frames',
+        choices=frames.FORMATS,
+        default="jl",
+        help='Store reads inline (jl), in a binary sidecar (bin) or as deltas')
+    parser.add_argument('--keyframe-interval',
+                        type=int,
+                        default=frames.DEFAULT_KEYFRAME_INTERVAL,
+                        help='--frames delta: store a full read this often')
     util.add_bool_arg(parser,
                       "--read-init",
                       default=True,
@@ -293,32 +677,77 @@ if __name__ == "__main__":
                       "--test",
                       default=False,
                       help="Run full software quickly")
+    util.add_bool_arg(
+        parser,
+        "--minipro-stdout",
+        default=False,
+        help="Read via minipro stdout (-r -) instead of a temp file")
+    util.add_bool_arg(parser,
+                      "--timing",
+                      default=False,
+                      help="Record per read timestamps and stage durations")
+    parser.add_argument('--sync-records',
+                        type=int,
+                        default=ejl.DEFAULT_SYNC_RECORDS,
+                        help='fsync the log at least every this many records')
+    parser.add_argument('--sync-interval',
+                        type=float,
+                        default=ejl.DEFAULT_SYNC_INTERVAL,
+                        help='fsync the log at least every this many seconds')
+    util.add_bool_arg(
+        parser,
+        "--resume",
+        default=False,
+        help="Continue an interrupted run in --dir instead of starting over")
     util.add_bool_arg(parser, "--verbose", default=False)
     args = parser.parse_args()
 
+    stations = [parse_station(s) for s in args.station]
+    if bool(stations) == bool(args.device):
+        parser.error("Need exactly one of --device or --station")
+    if stations and args.sn:
+        parser.error("--station gives the S/N")
+    if args.resume and not args.dir:
+        parser.error("--resume needs the --dir to resume")
+
     log_dir = args.dir
     if log_dir is None:
         postfix = args.postfix
         # keep a descriptive default name
         if postfix is None:
-            postfix = "sn-%s_bulb-%s" % (args.sn, args.bulb)
+            sn = args.sn
+            if stations:
+                sn = "+".join(station["sn"] for station in stations)
+            postfix = "sn-%s_bulb-%s" % (sn, args.bulb)
         log_dir = util.default_date_dir("log", "", postfix)
 
     timeout = args.timeout
     if timeout < 1.0:
         timeout = None
 
-    run(log_dir,
-        args.device,
-        passes=args.passes,
-        erased_threshold=args.erased_threshold,
-        interval=args.interval,
-        read_init=args.read_init,
-        write_init=args.write_init,
-        eraser=args.eraser,
-        bulb=args.bulb,
-        user=args.user,
-        sn=args.sn,
-        timeout=timeout,
-        test=args.test,
-        verbose=args.verbose)
+    kwargs = dict(passes=args.passes,
+                  erased_threshold=args.erased_threshold,
+                  interval=args.interval,
+                  interval_min=args.interval_min,
+                  interval_max=args.interval_max,
+                  adapt_step=args.adapt_step,
+                  pipeline=args.pipeline,
+                  timing=args.timing,
+                  sync_records=args.sync_records,
+                  sync_interval=args.sync_interval,
+                  resume=args.resume,
+                  read_init=args.read_init,
+                  write_init=args.write_init,
+                  eraser=args.eraser,
+                  bulb=args.bulb,
+                  user=args.user,
+                  timeout=timeout,
+                  test=args.test,
+                  frame_format=args.frames,
+                  keyframe_interval=args.keyframe_interval,
+                  minipro_stdout=args.minipro_stdout,
+                  verbose=args.verbose)
+    if stations:
+        run_stations(log_dir, stations, **kwargs)
+    else:
+        run(log_dir, args.device, sn=args.sn, **kwargs)
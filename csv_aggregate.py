@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
 import argparse
-import statistics
+import json
+import math
+import os
+from fractions import Fraction
 
 
 def write_header(f):
@@ -39,52 +42,221 @@ def load_csv_as_j(fn):
         yield j
 
 
-# statistics.median
-def rms(l):
-    squared = sum([x**2 for x in l])
-    return (squared / len(l))**0.5
+class RunningStats:
+    """
+    Mergeable count, sum of squares (=> RMS) and Welford mean / variance
 
+    Kept as exact fractions of the (float) inputs so the result doesn't
+    depend on the order values were added, merged or removed in: folding
+    rows in one at a time gives the same aggregate.csv as a full recompute
+    """
 
-def run(csv_in, csv_out):
-    global stats
+    def __init__(self):
+        self.n = 0
+        self.sum_sq = Fraction(0)
+        self.mean = Fraction(0)
+        # Sum of squared differences from the mean
+        self.m2 = Fraction(0)
 
-    f = open(csv_out, "w")
-    write_header(f)
+    def add(self, x):
+        x = Fraction(x)
+        self.n += 1
+        self.sum_sq += x * x
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
 
-    # key as (vendor, device)
-    products = {}
+    def remove(self, x):
+        """Undo add(x)"""
+        x = Fraction(x)
+        if self.n <= 1:
+            self.__init__()
+            return
+        mean = (self.mean * self.n - x) / (self.n - 1)
+        self.m2 -= (x - mean) * (x - self.mean)
+        self.mean = mean
+        self.sum_sq -= x * x
+        self.n -= 1
 
-    for rowj in load_csv_as_j(csv_in):
-        rows = products.setdefault((rowj["vendor"], rowj["device"]), [])
-        rows.append(rowj)
+    def merge(self, other):
+        n = self.n + other.n
+        if not n:
+            return
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.mean += delta * other.n / n
+        self.sum_sq += other.sum_sq
+        self.n = n
 
-    print("Found %u products" % len(products))
+    def rms(self):
+        if not self.n:
+            return 0.0
+        return math.sqrt(self.sum_sq / self.n)
 
-    for (entryk, rows) in sorted(products.items()):
-        (vendor, device) = entryk
-        sns = sorted([row["sn"] for row in rows])
+    def stdev(self):
+        """Sample standard deviation like statistics.stdev()"""
+        if self.n < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.n - 1))
+
+    def to_j(self):
+        return {
+            "n": self.n,
+            "sum_sq": str(self.sum_sq),
+            "mean": str(self.mean),
+            "m2": str(self.m2),
+        }
+
+    @staticmethod
+    def from_j(j):
+        ret = RunningStats()
+        ret.n = j["n"]
+        ret.sum_sq = Fraction(j["sum_sq"])
+        ret.mean = Fraction(j["mean"])
+        ret.m2 = Fraction(j["m2"])
+        return ret
+
+
+class Product:
+    """Running aggregate of one (vendor, device)"""
+
+    def __init__(self):
+        # sn => runs, so runs can be removed again
+        self.sns = {}
+        self.t50 = RunningStats()
+        self.t100 = RunningStats()
+
+    def add(self, sn, t50, t100, sign=1):
+        """sign -1 removes a previously added run"""
+        self.sns[sn] = self.sns.get(sn, 0) + sign
+        if not self.sns[sn]:
+            del self.sns[sn]
         # Drop 0 (invalid) entries
-        t50s = sorted([row["t50_norm"] for row in rows if row["t50_norm"]])
-        t100s = sorted([row["t100_norm"] for row in rows if row["t100_norm"]])
+        for stats, x in ((self.t50, t50), (self.t100, t100)):
+            if x:
+                if sign > 0:
+                    stats.add(x)
+                else:
+                    stats.remove(x)
+
+    def write_row(self, f, vendor, device):
         # maybe RMS or median?
-        t50_stddev = 0.0
-        t50 = 0.0
-        if t50s:
-            t50 = rms(t50s)
-            if len(t50s) >= 2:
-                t50_stddev = statistics.stdev(t50s)
-        t100 = 0.0
-        t100_stddev = 0.0
-        if t100s:
-            t100 = rms(t100s)
-            if len(t100s) >= 2:
-                t100_stddev = statistics.stdev(t100s)
-        n = max(len(t50s), len(t100s))
-        sns = sorted(set(sns))
-        write_row(f, vendor, device, t50, t100, n, sns, t50_stddev,
-                  t100_stddev)
-
-    f.close()
+        n = max(self.t50.n, self.t100.n)
+        write_row(f, vendor, device, self.t50.rms(), self.t100.rms(), n,
+                  sorted(self.sns), self.t50.stdev(), self.t100.stdev())
+
+
+class Aggregate:
+    """
+    runs.csv rows grouped by (vendor, device), updated in place as rows are
+    added, changed or removed
+    """
+
+    def __init__(self):
+        # key as (vendor, device)
+        self.products = {}
+        # dir => [vendor, device, sn, t50_norm, t100_norm] folded in
+        self.rows = {}
+
+    def _add(self, row, sign):
+        vendor, device, sn, t50, t100 = row
+        product = self.products.setdefault((vendor, device), Product())
+        product.add(sn, t50, t100, sign=sign)
+        if not product.sns:
+            del self.products[(vendor, device)]
+
+    def update(self, rowjs):
+        """
+        Make the aggregate match rowjs (all runs.csv rows)
+        Only new, changed and removed rows are folded in / out
+        Returns (added, removed) row counts
+        """
+        added = 0
+        removed = 0
+        seen = set()
+        for rowj in rowjs:
+            d = rowj["dir"]
+            seen.add(d)
+            row = [
+                rowj["vendor"], rowj["device"], rowj["sn"], rowj["t50_norm"],
+                rowj["t100_norm"]
+            ]
+            old = self.rows.get(d)
+            if old == row:
+                continue
+            if old is not None:
+                self._add(old, -1)
+                removed += 1
+            self._add(row, 1)
+            self.rows[d] = row
+            added += 1
+        for d in set(self.rows) - seen:
+            self._add(self.rows.pop(d), -1)
+            removed += 1
+        return added, removed
+
+    def write(self, csv_out):
+        f = open(csv_out, "w")
+        write_header(f)
+        for (vendor, device), product in sorted(self.products.items()):
+            product.write_row(f, vendor, device)
+        f.close()
+
+    def save(self, fn):
+        products = []
+        for (vendor, device), product in sorted(self.products.items()):
+            products.append({
+                "vendor": vendor,
+                "device": device,
+                "sns": product.sns,
+                "t50": product.t50.to_j(),
+                "t100": product.t100.to_j(),
+            })
+        j = {"rows": self.rows, "products": products}
+        with open(fn + ".tmp", "w") as f:
+            json.dump(j, f)
+        os.replace(fn + ".tmp", fn)
+
+    @staticmethod
+    def load(fn):
+        ret = Aggregate()
+        with open(fn, "r") as f:
+            j = json.load(f)
+        ret.rows = j["rows"]
+        for productj in j["products"]:
+            product = Product()
+            product.sns = productj["sns"]
+            product.t50 = RunningStats.from_j(productj["t50"])
+            product.t100 = RunningStats.from_j(productj["t100"])
+            ret.products[(productj["vendor"], productj["device"])] = product
+        return ret
+
+
+def run(csv_in, csv_out, state_fn=None):
+    """
+    state_fn: persisted Aggregate. Only rows that changed since the last
+    run are folded in
+    """
+    agg = Aggregate()
+    if state_fn and os.path.exists(state_fn):
+        agg = Aggregate.load(state_fn)
+    added, removed = agg.update(load_csv_as_j(csv_in))
+    print("%u rows added, %u removed" % (added, removed))
+    print("Found %u products" % len(agg.products))
+    agg.write(csv_out)
+    if state_fn:
+        agg.save(state_fn)
+    print("Wrote %s" % csv_out)
+
+
+def aggregate(rowjs, csv_out):
+    """
+    rowjs: runs.csv rows as dicts (see load_csv_as_j())
+    """
+    agg = Aggregate()
+    agg.update(rowjs)
+    print("Found %u products" % len(agg.products))
+    agg.write(csv_out)
     print("Wrote %s" % csv_out)
 
 
@@ -98,9 +270,13 @@ def main():
                         default="db/aggregate.csv",
                         nargs="?",
                         help='.csv out')
+    parser.add_argument(
+        '--state',
+        default=None,
+        help='Running aggregate (.json) to update instead of recomputing')
     args = parser.parse_args()
 
-    run(args.csv_in, args.csv_out)
+    run(args.csv_in, args.csv_out, state_fn=args.state)
 
 
 if __name__ == "__main__":
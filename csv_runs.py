@@ -7,22 +7,36 @@ TODO:
 """
 
 import argparse
-stats = None
 import os
-import glob
+import io
+import contextlib
+import multiprocessing
+import eetime.cache
+import eetime.jl
+from eetime import util
+import stats
 
 
 def find_jl_dirs(root_dir):
-    if os.path.isdir(root_dir) and glob.glob(root_dir + "/*.jl"):
-        yield root_dir
-
+    """
+    Directories at or below root_dir that contain .jl files
+    Parents before children, siblings sorted, so the order is stable
+    """
     # yield "prod/prod/2022-03-23_04_pe140t-2/2022-03-23_01_ee17/"
-    for f in os.listdir(root_dir):
-        d = os.path.join(root_dir, f)
-        # A subdir with .jl files?
-        if os.path.isdir(d):
-            for d2 in find_jl_dirs(d):
-                yield d2
+    todo = [root_dir]
+    while todo:
+        d = todo.pop()
+        subdirs = []
+        has_jl = False
+        with os.scandir(d) as it:
+            for entry in it:
+                if entry.is_dir():
+                    subdirs.append(entry.path)
+                elif entry.name.endswith(".jl"):
+                    has_jl = True
+        if has_jl:
+            yield d
+        todo += sorted(subdirs, reverse=True)
 
 
 def write_header(f):
@@ -120,24 +134,97 @@ def normalize_txx(statj):
     statj["t100_adj"] = statj["t100"] * scalar
 
 
-def run(root_dir, csv_fn, sns_fn=None, strict=True):
-    global stats
+def analyze_dir(task):
+    """
+    stats.run() on one directory. Runs in a worker process w/ --jobs
+    Returns (statj, exception, cache, output)
+    output: what stats printed, if capture was requested
+    """
+    d, cache, capture, dataset = task
+    out = io.StringIO()
+    statj = None
+    exception = None
+    with contextlib.ExitStack() as stack:
+        if capture:
+            stack.enter_context(contextlib.redirect_stdout(out))
+        try:
+            statj = stats.run(d=d, cache=cache, dataset=dataset)
+        except Exception as e:
+            exception = e
+    return statj, exception, cache, out.getvalue()
 
+
+def analyze_dirs(root_dir, cache=None, jobs=1, dataset=None):
+    """
+    Yield (d, statj, exception) in find_jl_dirs() order
+    jobs > 1 analyzes directories in parallel worker processes
+    dataset: eetime.columnar.Dataset to take runs from instead of root_dir
+    """
+    if dataset is not None:
+        # Already parsed, workers wouldn't help
+        for d in dataset.dirs(root_dir):
+            statj, exception, _cache, _output = analyze_dir(
+                (d, None, False, dataset))
+            yield d, statj, exception
+        return
+
+    def tasks():
+        for d in find_jl_dirs(root_dir):
+            fns = eetime.jl.expand_jls_arg([d])
+            # Only ship the relevant entries to the worker
+            task_cache = cache.subset(fns) if cache else None
+            yield d, fns, (d, task_cache, jobs > 1, None)
+
+    def merge(fns, results):
+        statj, exception, task_cache, output = results
+        if output:
+            print(output, end="")
+        if cache:
+            cache.merge(task_cache, fns)
+        return statj, exception
+
+    if jobs <= 1:
+        for d, fns, task in tasks():
+            yield (d, ) + merge(fns, analyze_dir(task))
+        return
+
+    # Directory discovery is cheap: do it up front so results can be
+    # paired back up with their directory in order
+    todo = list(tasks())
+    with multiprocessing.Pool(jobs) as pool:
+        results = pool.imap(analyze_dir, [task for _d, _fns, task in todo])
+        for (d, fns, _task), result in zip(todo, results):
+            yield (d, ) + merge(fns, result)
+
+
+def run(root_dir,
+        csv_fn,
+        sns_fn=None,
+        strict=True,
+        cache=None,
+        jobs=1,
+        dataset=None):
+    """
+    cache: eetime.cache.SummaryCache so unchanged .jl files aren't reparsed
+    jobs: analyze this many directories in parallel
+    dataset: eetime.columnar.Dataset (export.py of root_dir) to use instead
+        of the .jl files
+    """
     sns = load_sns(sns_fn)
 
     f = open(csv_fn, "w")
     write_header(f)
 
-    # takes a long time to import
-    if stats is None:
-        import stats
-
     processed = 0
     tries = 0
-    for d in find_jl_dirs(root_dir):
+    for d, statj, exception in analyze_dirs(root_dir,
+                                            cache=cache,
+                                            jobs=jobs,
+                                            dataset=dataset):
         tries += 1
         try:
-            statj = stats.run(d=d)
+            if exception:
+                raise exception
             if statj["n"] == 0:
                 print("WARNING: skipping bad dir %s" % d)
                 if strict:
@@ -173,6 +260,27 @@ def main():
     parser = argparse.ArgumentParser(
         description="Generate a .csv w/ high level stats")
     parser.add_argument('--sns', default="db/sns.csv", help='S/N .csv in')
+    parser.add_argument('--cache',
+                        default="db/summary_cache.json",
+                        help='Per .jl summary cache')
+    parser.add_argument('--no-cache',
+                        action="store_true",
+                        help='Parse every .jl, ignoring the cache')
+    parser.add_argument('--rebuild-cache',
+                        action="store_true",
+                        help='Discard the cache and rebuild it')
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help='Analyze this many directories in parallel')
+    parser.add_argument(
+        '--dataset',
+        default=None,
+        help='Columnar export (export.py) to read instead of the .jl files')
+    util.add_bool_arg(parser,
+                      "--strict",
+                      default=True,
+                      help="Stop on the first bad directory")
     parser.add_argument('root_dir',
                         default="db/prod",
                         nargs="?",
@@ -183,7 +291,26 @@ def main():
                         help='.csv out')
     args = parser.parse_args()
 
-    run(root_dir=args.root_dir, csv_fn=args.csv, sns_fn=args.sns)
+    dataset = None
+    if args.dataset:
+        from eetime import columnar
+        dataset = columnar.Dataset(args.dataset)
+    cache = None
+    if not args.no_cache and not dataset:
+        cache = eetime.cache.SummaryCache(args.cache,
+                                          rebuild=args.rebuild_cache)
+    try:
+        run(root_dir=args.root_dir,
+            csv_fn=args.csv,
+            sns_fn=args.sns,
+            strict=args.strict,
+            cache=cache,
+            jobs=args.jobs,
+            dataset=dataset)
+    finally:
+        if cache:
+            cache.save()
+            cache.print_stats()
 
 
 if __name__ == "__main__":
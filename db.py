@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+SQLite database of runs (default db/runs.sqlite)
+
+Holds S/N => vendor, device and, per run directory, its header metadata
+(sn, programmer, eraser, bulb) plus the computed t50 / t100
+ingest only reanalyzes directories whose .jl files changed since the last
+ingest, so it can be rerun after every collection:
+
+    ./db.py sns db/sns.csv
+    ./db.py ingest db/prod
+    ./db.py query --vendor Intel --bulb 3
+    ./db.py csv db/runs.csv db/aggregate.csv
+
+The .csv files are the same as csv_runs.py / csv_aggregate.py would write
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import eetime.jl
+from eetime import util
+import csv_aggregate
+import csv_runs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sns (
+    sn TEXT PRIMARY KEY,
+    vendor TEXT NOT NULL,
+    device TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    -- Relative to the database file's directory
+    dir TEXT PRIMARY KEY,
+    sn TEXT NOT NULL,
+    prog TEXT,
+    prog_dev TEXT,
+    eraser TEXT,
+    bulb TEXT,
+    n INTEGER NOT NULL,
+    t50_raw REAL NOT NULL,
+    t100_raw REAL NOT NULL,
+    t50_norm REAL NOT NULL,
+    t100_norm REAL NOT NULL,
+    -- Header of the first .jl
+    header TEXT NOT NULL,
+    -- .jl names, sizes and mtimes the row was computed from
+    signature TEXT NOT NULL,
+    ingested TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_sn ON runs (sn);
+CREATE INDEX IF NOT EXISTS runs_eraser_bulb ON runs (eraser, bulb);
+CREATE INDEX IF NOT EXISTS sns_vendor_device ON sns (vendor, device);
+"""
+
+# Query filters: option => column
+FILTERS = {
+    "vendor": "sns.vendor",
+    "device": "sns.device",
+    "sn": "runs.sn",
+    "prog": "runs.prog",
+    "eraser": "runs.eraser",
+    "bulb": "runs.bulb",
+}
+
+
+def connect(fn):
+    d = os.path.dirname(fn)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    conn = sqlite3.connect(fn)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def dir_signature(d):
+    """Changes whenever a .jl in d is added, removed or rewritten"""
+    ret = []
+    for fn in eetime.jl.expand_jls_arg([d]):
+        st = os.stat(fn)
+        ret.append([os.path.basename(fn), st.st_size, st.st_mtime_ns])
+    return json.dumps(ret)
+
+
+def load_sns(conn, sns_fn):
+    """Add / update S/Ns from a sn,vendor,model .csv"""
+    sns = csv_runs.load_sns(sns_fn)
+    with conn:
+        conn.executemany(
+            "INSERT INTO sns (sn, vendor, device) VALUES (?, ?, ?)"
+            " ON CONFLICT (sn) DO UPDATE"
+            " SET vendor = excluded.vendor, device = excluded.device",
+            [(sn, vendor, device) for sn, (vendor, device) in sns.items()])
+    print("Loaded %u S/Ns from %s" % (len(sns), sns_fn))
+
+
+def base_dir(conn):
+    """Run directories are stored relative to the database's directory"""
+    return os.path.dirname(conn.execute("PRAGMA database_list").fetchone()[2])
+
+
+def dir_key(conn, d):
+    """Same key for any spelling of d (./c, c/, absolute, other cwd)"""
+    return os.path.relpath(os.path.abspath(d), base_dir(conn))
+
+
+def key_dir(conn, key):
+    """dir_key() back to a path from the current directory"""
+    return os.path.relpath(os.path.join(base_dir(conn), key))
+
+
+def under(d, root_dir):
+    d = os.path.normpath(d)
+    root_dir = os.path.normpath(root_dir)
+    return root_dir == "." or d == root_dir or d.startswith(
+        os.path.join(root_dir, ""))
+
+
+def upsert_run(conn, d, statj, signature):
+    csv_runs.normalize_txx(statj)
+    h = statj["header"]
+    conn.execute(
+        "INSERT OR REPLACE INTO runs (dir, sn, prog, prog_dev, eraser, bulb,"
+        " n, t50_raw, t100_raw, t50_norm, t100_norm, header, signature,"
+        " ingested) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (d, h["sn"], h["prog"], h["prog_dev"], h["eraser"], h["bulb"],
+         statj["n"], statj["t50"], statj["t100"],
+         statj["t50_adj"], statj["t100_adj"], json.dumps(h), signature,
+         datetime.datetime.utcnow().isoformat()))
+
+
+def ingest(conn, root_dir, strict=True, prune=True):
+    """
+    Add / update run directories at or below root_dir
+    Directories whose .jl files haven't changed are skipped
+    prune: drop rows for directories below root_dir that no longer have runs
+    """
+    signatures = dict(conn.execute("SELECT dir, signature FROM runs"))
+    seen = set()
+    added = 0
+    updated = 0
+    unchanged = 0
+    for d in csv_runs.find_jl_dirs(root_dir):
+        key = dir_key(conn, d)
+        seen.add(key)
+        signature = dir_signature(d)
+        if signatures.get(key) == signature:
+            unchanged += 1
+            continue
+        statj, exception, _cache, output = csv_runs.analyze_dir(
+            (d, None, True, None))
+        try:
+            if exception:
+                raise exception
+            if statj["n"] == 0:
+                raise Exception("skipping bad dir %s" % d)
+            with conn:
+                upsert_run(conn, key, statj, signature)
+        except Exception as e:
+            print(output, end="")
+            print("WARNING: %s: %s" % (d, e))
+            if strict:
+                raise
+            with conn:
+                conn.execute("DELETE FROM runs WHERE dir = ?", (key, ))
+            continue
+        if key in signatures:
+            updated += 1
+            print("Updated %s" % d)
+        else:
+            added += 1
+            print("Added %s" % d)
+
+    pruned = 0
+    if prune:
+        root_key = dir_key(conn, root_dir)
+        for key in signatures:
+            if key not in seen and under(key, root_key):
+                print("Removed %s" % key_dir(conn, key))
+                with conn:
+                    conn.execute("DELETE FROM runs WHERE dir = ?", (key, ))
+                pruned += 1
+    print("")
+    print("%u added, %u updated, %u unchanged, %u removed" %
+          (added, updated, unchanged, pruned))
+
+
+def query(conn, root_dir=None, **filters):
+    """
+    Runs (with their vendor / device) matching filters (see FILTERS)
+    In csv_runs.find_jl_dirs() order, dir relative to the current directory
+    """
+    where = []
+    args = []
+    for k, v in filters.items():
+        if v is not None:
+            where.append("%s = ?" % FILTERS[k])
+            args.append(v)
+    sql = "SELECT runs.*, sns.vendor, sns.device FROM runs"
+    sql += " LEFT JOIN sns ON sns.sn = runs.sn"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    rows = conn.execute(sql, args).fetchall()
+    if root_dir is not None:
+        root_key = dir_key(conn, root_dir)
+        rows = [row for row in rows if under(row["dir"], root_key)]
+    rows = sorted(rows, key=lambda row: row["dir"].split(os.sep))
+    ret = []
+    for row in rows:
+        row = dict(row)
+        row["dir"] = key_dir(conn, row["dir"])
+        ret.append(row)
+    return ret
+
+
+def row_statj(row):
+    """Row as csv_runs.write_row() expects"""
+    return {
+        "header": json.loads(row["header"]),
+        "n": row["n"],
+        "t50": row["t50_raw"],
+        "t100": row["t100_raw"],
+        "t50_adj": row["t50_norm"],
+        "t100_adj": row["t100_norm"],
+    }
+
+
+def write_runs(f, rows, strict=True):
+    """rows from query() as runs.csv. Returns rows written"""
+    csv_runs.write_header(f)
+    ret = []
+    for row in rows:
+        vendor = row["vendor"]
+        device = row["device"]
+        if vendor is None:
+            print("WARNING: failed to find sn: %s" % row["sn"],
+                  file=sys.stderr)
+            if strict:
+                raise Exception("failed to find sn: %s" % row["sn"])
+            vendor = ""
+            device = ""
+        csv_runs.write_row(f, row["dir"], vendor, device, row_statj(row))
+        ret.append(row)
+    return ret
+
+
+def aggregate_rowjs(rows):
+    """rows as csv_aggregate.load_csv_as_j() would read them from runs.csv"""
+    for row in rows:
+        yield {
+            "dir": row["dir"],
+            "vendor": row["vendor"] or "",
+            "device": row["device"] or "",
+            "sn": row["sn"],
+            # runs.csv rounds, match it
+            "t50_norm": float("%0.1f" % row["t50_norm"]),
+            "t100_norm": float("%0.1f" % row["t100_norm"]),
+        }
+
+
+def write_csvs(conn, runs_fn, aggregate_fn=None, root_dir=None, strict=True):
+    rows = query(conn, root_dir=root_dir)
+    with open(runs_fn, "w") as f:
+        rows = write_runs(f, rows, strict=strict)
+    print("Wrote %u entries to %s" % (len(rows), runs_fn))
+    if aggregate_fn:
+        csv_aggregate.aggregate(aggregate_rowjs(rows), aggregate_fn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite run database")
+    parser.add_argument('--db', default="db/runs.sqlite", help='Database')
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_sns = subparsers.add_parser("sns", help="Load a S/N .csv")
+    parser_sns.add_argument('sns',
+                            default="db/sns.csv",
+                            nargs="?",
+                            help='S/N .csv in')
+
+    parser_ingest = subparsers.add_parser("ingest",
+                                          help="Add / update run directories")
+    parser_ingest.add_argument('--sns', default=None, help='Also load S/Ns')
+    util.add_bool_arg(parser_ingest,
+                      "--strict",
+                      default=True,
+                      help="Stop on the first bad directory")
+    util.add_bool_arg(
+        parser_ingest,
+        "--prune",
+        default=True,
+        help="Remove directories below root_dir that no longer have runs")
+    parser_ingest.add_argument('root_dir',
+                               default="db/prod",
+                               nargs="?",
+                               help='Directory to look around in')
+
+    parser_query = subparsers.add_parser(
+        "query", help="Print matching runs as runs.csv")
+    for k in FILTERS:
+        parser_query.add_argument('--' + k, default=None)
+    parser_query.add_argument('--dir',
+                              default=None,
+                              help='Only runs at or below this directory')
+
+    parser_csv = subparsers.add_parser("csv",
+                                       help="Write runs.csv and aggregate.csv")
+    util.add_bool_arg(parser_csv,
+                      "--strict",
+                      default=True,
+                      help="Fail on runs with an unknown S/N")
+    parser_csv.add_argument('--dir',
+                            default=None,
+                            help='Only runs at or below this directory')
+    parser_csv.add_argument('runs_csv',
+                            default="db/runs.csv",
+                            nargs="?",
+                            help='.csv out')
+    parser_csv.add_argument('aggregate_csv',
+                            default="db/aggregate.csv",
+                            nargs="?",
+                            help='csv_aggregate.py .csv out')
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    try:
+        if args.command == "sns":
+            load_sns(conn, args.sns)
+        elif args.command == "ingest":
+            if args.sns:
+                load_sns(conn, args.sns)
+            ingest(conn, args.root_dir, strict=args.strict, prune=args.prune)
+        elif args.command == "query":
+            filters = dict((k, getattr(args, k)) for k in FILTERS)
+            rows = query(conn, root_dir=args.dir, **filters)
+            write_runs(sys.stdout, rows, strict=False)
+        elif args.command == "csv":
+            write_csvs(conn,
+                       args.runs_csv,
+                       args.aggregate_csv,
+                       root_dir=args.dir,
+                       strict=args.strict)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
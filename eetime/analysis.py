@@ -0,0 +1,106 @@
+"""
+Erase curve analysis (t50, t100)
+
+Kept free of heavy imports (numpy, scipy, matplotlib) so that the command line
+tools that only need this start quickly
+"""
+
+import eetime.jl
+
+
+def decode(reads):
+    times = []
+    percentages = []
+    for aread in reads:
+        times.append(aread["seconds"])
+        percentages.append(aread["erase_percent"])
+    return times, percentages
+
+
+def lin_interp_50p(xs, ys, thresh=50.0):
+    """
+    Linear interpolation to find the 50% erase mark
+    In practice sets increase pretty rapidly around 50% so this should be reliable
+    """
+
+    if len(xs) < 2:
+        print("WARNING: interpolation failed (insufficient entries)")
+        return 0.0
+
+    if ys[0] > 0.0:
+        print("WARNING: interpolation failed (t0 not filled)")
+        return 0.0
+
+    for i, (ax, ay) in enumerate(zip(xs, ys)):
+        if ay >= thresh:
+            break
+    else:
+        raise Exception("Interpolation failed (failed to hit thresh)")
+
+    if i == 0:
+        i = 1
+
+    # on the off chance we land at a stable point bump around
+    while True:
+        if ys[i - 1] == ys[i]:
+            print("WARNING: searching for better 50p point")
+            i += 1
+        else:
+            break
+
+    x0 = xs[i - 1]
+    x1 = xs[i]
+    y0 = ys[i - 1]
+    y1 = ys[i]
+
+    m = (y1 - y0) / (x1 - x0)
+    c = y0 - x0 * m
+    # c = y1 - x1 * m
+
+    thalf = (50 - c) / m
+    print("thalf: %0.1f" % thalf)
+    print("  x=%u => y=%0.1f" % (x0, y0))
+    print("  x=%u => y=%0.1f" % (x1, y1))
+    return thalf
+
+
+def find_t100(ts, ps):
+    prevt = None
+    # Move backwards until we find first entry not 100%
+    # then report the last entry, which was the first stable 100%
+    for t, p in zip(reversed(ts), reversed(ps)):
+        if prevt is None:
+            assert p == 100.0
+        if p < 100.0:
+            if prevt is None:
+                return 0.0
+            else:
+                return prevt
+        prevt = t
+    return 0.0
+
+
+def summarize_jl(fn):
+    """
+    Per file results used by run()
+    Plain JSON so that it can be cached (see eetime.cache)
+    footer is None for incomplete runs
+    """
+    header, footer, reads = eetime.jl.load_jl(fn,
+                                              fields=eetime.jl.CURVE_FIELDS)
+    return summarize(header, footer, reads)
+
+
+def summarize(header, footer, reads):
+    """summarize_jl() of an already loaded run"""
+    j = {
+        "header": header,
+        "footer": footer,
+        "entries": len(reads),
+    }
+    if footer:
+        times, percentages = decode(reads)
+        print("%u entries" % len(times))
+        j["t50"] = lin_interp_50p(times, percentages)
+        j["t100"] = find_t100(times, percentages)
+    return j
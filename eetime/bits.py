@@ -0,0 +1,131 @@
+"""
+Per bit erase times
+
+A bit map holds, for every bit of the device, the read (iter) at which it
+first read as erased (1)
+    0: already erased in the init read (ex: never programmed). Not used for
+        --write-init runs: their init read is from before the chip was
+        written
+    NEVER: not erased by the end of the run
+Bit k is byte k // 8, bit k % 8 (LSB first)
+
+Stored as uint16 .npy next to the .jl (iter_01.jl => iter_01.bits.npy)
+"""
+
+import os
+import numpy as np
+from eetime import jl as ejl
+
+NEVER = 0xFFFF
+
+
+def bits_fn(fn_jl):
+    return os.path.splitext(fn_jl)[0] + ".bits.npy"
+
+
+def unpack(buf):
+    return np.unpackbits(np.frombuffer(buf, dtype=np.uint8), bitorder="little")
+
+
+class BitMapper:
+    """
+    Build a bit map one frame at a time
+
+    Only bytes that still have bits waiting to erase are unpacked so late
+    (mostly erased) frames are cheap
+    """
+
+    def __init__(self, frame_size):
+        self.frame_size = frame_size
+        self.iters = np.full(frame_size * 8, NEVER, dtype=np.uint16)
+        # Bits that haven't read erased yet (packed)
+        self.pending = np.full(frame_size, 0xFF, dtype=np.uint8)
+
+    def add(self, iter, buf):
+        if len(buf) != self.frame_size:
+            raise ValueError("Expected %u byte frame, got %u" %
+                             (self.frame_size, len(buf)))
+        if iter >= NEVER:
+            raise ValueError("Too many reads for uint16 bit map")
+        new = np.frombuffer(buf, dtype=np.uint8) & self.pending
+        byte_is = np.flatnonzero(new)
+        if not len(byte_is):
+            return
+        self.pending[byte_is] &= ~new[byte_is]
+        new_bits = np.unpackbits(new[byte_is],
+                                 bitorder="little").reshape(-1, 8)
+        rows, cols = np.nonzero(new_bits)
+        self.iters[byte_is[rows] * 8 + cols] = iter
+
+    def remaining(self):
+        """Bits not yet erased"""
+        return int(unpack(self.pending.tobytes()).sum())
+
+
+def written_at_start(header, footer):
+    """
+    Chip was written (zeroed) after the header init read, so that read
+    isn't the state the erase started from
+    """
+    if header.get("write_init"):
+        return True
+    # Older runs only have the write time in the footer
+    return bool(footer) and footer.get("prog_time") is not None
+
+
+def bit_map(fn):
+    """
+    Decode fn's frames once, in order, returning the bit map
+    Frames are streamed so only one is held at a time
+    """
+    index = ejl.JLIndex(fn)
+    try:
+        header = index.header()
+        mapper = None
+        init = None
+        if not written_at_start(header, index.footer()):
+            init = ejl.decode_frame(fn, header, header)
+        if init is not None:
+            mapper = BitMapper(len(init))
+            mapper.add(0, init)
+        for j, buf in ejl.iter_frames(fn, header, index.reads()):
+            if buf is None:
+                continue
+            if mapper is None:
+                mapper = BitMapper(len(buf))
+            mapper.add(j["iter"], buf)
+    finally:
+        index.close()
+    if mapper is None:
+        raise ValueError("%s: no frames" % (fn, ))
+    return mapper.iters
+
+
+def load_bit_map(fn, rebuild=False):
+    """bit_map(fn), via the .npy if it's up to date"""
+    fn_npy = bits_fn(fn)
+    if not rebuild and os.path.exists(fn_npy) and os.path.getmtime(
+            fn_npy) >= os.path.getmtime(fn):
+        return np.load(fn_npy)
+    iters = bit_map(fn)
+    tmp = fn_npy + ".tmp.npy"
+    try:
+        np.save(tmp, iters)
+        os.replace(tmp, fn_npy)
+    except OSError:
+        # Read only corpus? Still works, just isn't reused
+        pass
+    return iters
+
+
+def bit_seconds(iters, reads):
+    """
+    Bit map to float32 seconds since the start of the pass
+    reads: read records with iter and seconds (see jl.CURVE_FIELDS)
+    Bits erased at init are 0, never erased are nan
+    """
+    lut = np.full(NEVER + 1, np.nan, dtype=np.float32)
+    lut[0] = 0.0
+    for j in reads:
+        lut[j["iter"]] = j["seconds"]
+    return lut[iters]
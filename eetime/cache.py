@@ -0,0 +1,114 @@
+"""
+Persistent cache of per-.jl analysis results (ex: t50, t100)
+
+Entries are keyed by absolute path and validated by size + mtime
+If only the mtime changed but the size and header didn't (ex: touched, or
+restored in place from a backup), the entry is still used. Only the header
+line is hashed so that validating never reads the whole .jl again. A corpus
+copied or moved elsewhere is a different path and starts over
+"""
+
+import hashlib
+import json
+import os
+
+CACHE_VERSION = 2
+
+
+def header_md5(fn):
+    """md5 of the header line (user, sn, ... see annotate.py)"""
+    with open(fn, "rb") as f:
+        return hashlib.md5(f.readline()).hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, fn, rebuild=False):
+        """
+        fn: cache file. None for in memory only
+        rebuild: ignore anything already in fn
+        """
+        self.fn = fn
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        if fn and not rebuild and os.path.exists(fn):
+            with open(fn, "r") as f:
+                j = json.load(f)
+            if j.get("version") == CACHE_VERSION:
+                self.entries = j["entries"]
+
+    def key(self, fn):
+        return os.path.abspath(fn)
+
+    def get(self, fn):
+        """Cached summary for fn or None if missing / stale"""
+        k = self.key(fn)
+        entry = self.entries.get(k)
+        st = os.stat(fn)
+        if entry is not None and entry["size"] == st.st_size:
+            if entry["mtime"] == st.st_mtime:
+                self.hits += 1
+                return entry["summary"]
+            if entry["header_md5"] == header_md5(fn):
+                entry["mtime"] = st.st_mtime
+                self.hits += 1
+                return entry["summary"]
+        if entry is not None:
+            del self.entries[k]
+            self.evicted += 1
+        self.misses += 1
+        return None
+
+    def put(self, fn, summary):
+        st = os.stat(fn)
+        self.entries[self.key(fn)] = {
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "header_md5": header_md5(fn),
+            "summary": summary,
+        }
+
+    def subset(self, fns):
+        """In memory cache of only fns, ex: to hand to a worker process"""
+        ret = SummaryCache(None)
+        for fn in fns:
+            k = self.key(fn)
+            if k in self.entries:
+                ret.entries[k] = self.entries[k]
+        return ret
+
+    def merge(self, other, fns):
+        """Take fns entries and counters back from a subset()"""
+        for fn in fns:
+            k = self.key(fn)
+            if k in other.entries:
+                self.entries[k] = other.entries[k]
+            else:
+                self.entries.pop(k, None)
+        self.hits += other.hits
+        self.misses += other.misses
+        self.evicted += other.evicted
+
+    def evict_missing(self):
+        """Drop entries for files that no longer exist"""
+        for k in list(self.entries.keys()):
+            if not os.path.exists(k):
+                del self.entries[k]
+                self.evicted += 1
+
+    def save(self):
+        if not self.fn:
+            return
+        self.evict_missing()
+        d = os.path.dirname(self.fn)
+        if d and not os.path.exists(d):
+            os.makedirs(d, exist_ok=True)
+        tmp = self.fn + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": CACHE_VERSION, "entries": self.entries}, f)
+        os.replace(tmp, self.fn)
+
+    def print_stats(self):
+        print("Cache: %u hits, %u misses, %u evicted" %
+              (self.hits, self.misses, self.evicted))
@@ -0,0 +1,211 @@
+"""
+Columnar export of a .jl corpus (export.py) so bulk analysis doesn't reparse
+JSON lines
+
+Per run: fn, header / footer (JSON), where its reads are
+Per read: run, iter, seconds, erase_percent and optionally the frame
+
+Stored as one .npz or, with pyarrow, a directory of runs.parquet +
+reads.parquet. Run fns are kept as the .jl paths given at export time
+"""
+
+import json
+import os
+import numpy as np
+import eetime.jl
+
+VERSION = 1
+# Per read columns
+READ_FIELDS = ("iter", "seconds", "erase_percent")
+READ_DTYPES = {
+    "iter": np.int32,
+    "seconds": np.float64,
+    "erase_percent": np.float64,
+}
+
+
+def _frames(fn):
+    """All read frames of fn as one bytes, frame size"""
+    index = eetime.jl.JLIndex(fn)
+    try:
+        bufs = []
+        for _j, buf in eetime.jl.iter_frames(fn, index.header(),
+                                             index.reads()):
+            if buf is None:
+                raise ValueError("%s: read without a frame" % fn)
+            bufs.append(bytes(buf))
+    finally:
+        index.close()
+    return b"".join(bufs), len(bufs[0]) if bufs else 0
+
+
+def build(fns, frames=False, verbose=False):
+    """Columns (dict of arrays) for .jl files fns"""
+    runs = {"fn": [], "header": [], "footer": [], "read_count": []}
+    reads = dict((k, []) for k in READ_FIELDS)
+    frame_bufs = []
+    frame_sizes = []
+    for fn in fns:
+        if verbose:
+            print(fn)
+        header, footer, records = eetime.jl.load_jl(fn, fields=READ_FIELDS)
+        runs["fn"].append(os.path.normpath(fn))
+        runs["header"].append(json.dumps(header))
+        runs["footer"].append(json.dumps(footer))
+        runs["read_count"].append(len(records))
+        for k in READ_FIELDS:
+            reads[k] += [j[k] for j in records]
+        if frames:
+            buf, frame_size = _frames(fn)
+            frame_bufs.append(buf)
+            frame_sizes.append(frame_size)
+
+    cols = {
+        "version": np.array(VERSION),
+        "fn": np.array(runs["fn"], dtype=str),
+        "header": np.array(runs["header"], dtype=str),
+        "footer": np.array(runs["footer"], dtype=str),
+        "read_count": np.array(runs["read_count"], dtype=np.int64),
+    }
+    for k in READ_FIELDS:
+        cols[k] = np.array(reads[k], dtype=READ_DTYPES[k])
+    if frames:
+        cols["frame_size"] = np.array(frame_sizes, dtype=np.int64)
+        cols["frames"] = np.frombuffer(b"".join(frame_bufs), dtype=np.uint8)
+    return cols
+
+
+def save(cols, out):
+    """.npz if out ends in .npz, otherwise a parquet directory"""
+    if out.endswith(".npz"):
+        # Uncompressed: loads faster and frames are mostly incompressible
+        tmp = out[:-len(".npz")] + ".tmp.npz"
+        np.savez(tmp, **cols)
+        os.replace(tmp, out)
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(out, exist_ok=True)
+    runs = {"version": np.full(len(cols["fn"]), VERSION)}
+    for k in ("fn", "header", "footer", "read_count", "frame_size"):
+        if k in cols:
+            runs[k] = cols[k]
+    pq.write_table(pa.table(runs), os.path.join(out, "runs.parquet"))
+    reads = dict((k, cols[k]) for k in READ_FIELDS)
+    if "frames" in cols:
+        # One binary value per read
+        sizes = np.repeat(cols["frame_size"], cols["read_count"])
+        offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        reads["frame"] = pa.Array.from_buffers(
+            pa.large_binary(), len(sizes),
+            [None, pa.py_buffer(offsets),
+             pa.py_buffer(cols["frames"])])
+    pq.write_table(pa.table(reads), os.path.join(out, "reads.parquet"))
+
+
+def load(path):
+    """Columns saved by save()"""
+    if path.endswith(".npz"):
+        with np.load(path) as f:
+            cols = dict(f.items())
+    else:
+        import pyarrow.parquet as pq
+
+        runs = pq.read_table(os.path.join(path, "runs.parquet"))
+        reads = pq.read_table(os.path.join(path, "reads.parquet"))
+        cols = {"version": VERSION}
+        if len(runs):
+            cols["version"] = runs.column("version")[0].as_py()
+        for k in runs.column_names:
+            if k != "version":
+                cols[k] = runs.column(k).to_numpy(zero_copy_only=False)
+        for k in READ_FIELDS:
+            cols[k] = reads.column(k).to_numpy()
+        if "frame" in reads.column_names:
+            # Frames are back to back in the data buffer
+            frames = reads.column("frame").combine_chunks()
+            offsets = np.frombuffer(frames.buffers()[1], dtype=np.int64)
+            data = np.frombuffer(frames.buffers()[2], dtype=np.uint8)
+            start = offsets[frames.offset]
+            cols["frames"] = data[start:offsets[frames.offset + len(frames)]]
+    if int(cols["version"]) != VERSION:
+        raise ValueError("%s: unsupported version %s" %
+                         (path, cols["version"]))
+    return cols
+
+
+class Dataset:
+    """Runs of a columnar export, looked up by their .jl path"""
+
+    def __init__(self, path):
+        self.path = path
+        self.cols = load(path)
+        self.fns = [str(fn) for fn in self.cols["fn"]]
+        self.index = dict((fn, i) for i, fn in enumerate(self.fns))
+        counts = self.cols["read_count"]
+        self.read_start = np.concatenate(([0], np.cumsum(counts)))
+        if "frame_size" in self.cols:
+            self.frame_start = np.concatenate(
+                ([0], np.cumsum(counts * self.cols["frame_size"])))
+
+    def __len__(self):
+        return len(self.fns)
+
+    def __contains__(self, fn):
+        return os.path.normpath(fn) in self.index
+
+    def _i(self, fn):
+        return self.index[os.path.normpath(fn)]
+
+    def column(self, fn, k):
+        """Per read column k of run fn as an array"""
+        i = self._i(fn)
+        return self.cols[k][self.read_start[i]:self.read_start[i + 1]]
+
+    def header(self, fn):
+        return json.loads(str(self.cols["header"][self._i(fn)]))
+
+    def footer(self, fn):
+        return json.loads(str(self.cols["footer"][self._i(fn)]))
+
+    def run(self, fn, fields=READ_FIELDS):
+        """(header, footer, reads) like eetime.jl.load_jl()"""
+        fields = [k for k in fields if k in READ_FIELDS]
+        columns = [self.column(fn, k).tolist() for k in fields]
+        reads = [dict(zip(fields, values)) for values in zip(*columns)]
+        return self.header(fn), self.footer(fn), reads
+
+    def frames(self, fn):
+        """(reads, frame size) uint8 array of run fn's frames"""
+        if "frames" not in self.cols:
+            raise ValueError("%s was exported without frames" % self.path)
+        i = self._i(fn)
+        frame_size = int(self.cols["frame_size"][i])
+        buf = self.cols["frames"][self.frame_start[i]:self.frame_start[i + 1]]
+        return buf.reshape(-1, frame_size)
+
+    def select(self, path):
+        """
+        Runs matching a command line argument: a .jl or the .jl files
+        directly in a directory (like eetime.jl.expand_jls_arg())
+        """
+        path = os.path.normpath(path)
+        if path in self.index:
+            return [path]
+        return [fn for fn in self.fns if os.path.dirname(fn) == path]
+
+    def dirs(self, root_dir):
+        """
+        Directories at or below root_dir with runs, in csv_runs.find_jl_dirs()
+        order
+        """
+        root_dir = os.path.normpath(root_dir)
+        prefix = os.path.join(root_dir, "")
+        ret = set()
+        for fn in self.fns:
+            d = os.path.dirname(fn)
+            if d == root_dir or d.startswith(prefix) or root_dir == ".":
+                ret.add(d)
+        return sorted(ret, key=lambda d: d.split(os.sep))
@@ -0,0 +1,57 @@
+"""
+Erase curves (seconds, erase_percent) for plotting
+
+Extracted once per .jl and stored next to it (iter_01.jl =>
+iter_01.curve.npz) with its header / footer, so plots don't parse JSON again
+Rebuilt when older than the .jl
+"""
+
+import json
+import os
+import numpy as np
+from eetime import jl as ejl
+
+
+def curve_fn(fn_jl):
+    return os.path.splitext(fn_jl)[0] + ".curve.npz"
+
+
+def load_curve(fn, rebuild=False):
+    """(header, footer, seconds, erase_percent) of fn, via the cache"""
+    fn_npz = curve_fn(fn)
+    if not rebuild and os.path.exists(fn_npz) and os.path.getmtime(
+            fn_npz) >= os.path.getmtime(fn):
+        with np.load(fn_npz) as f:
+            return (json.loads(str(f["header"])), json.loads(str(f["footer"])),
+                    f["seconds"], f["erase_percent"])
+    header, footer, reads = ejl.load_jl(fn, fields=ejl.CURVE_FIELDS)
+    seconds = np.array([j["seconds"] for j in reads], dtype=np.float64)
+    percent = np.array([j["erase_percent"] for j in reads], dtype=np.float64)
+    tmp = fn_npz[:-len(".npz")] + ".tmp.npz"
+    try:
+        np.savez(tmp,
+                 header=json.dumps(header),
+                 footer=json.dumps(footer),
+                 seconds=seconds,
+                 erase_percent=percent)
+        os.replace(tmp, fn_npz)
+    except OSError:
+        # Read only corpus? Still works, just isn't reused
+        pass
+    return header, footer, seconds, percent
+
+
+def decimate(xs, ys, x0, x1, pixels):
+    """
+    Indices of the points of (xs, ys) worth drawing pixels wide over x0 to x1
+    Keeps the first, last, min and max point in each pixel column so the
+    drawn line looks the same. xs must be sorted
+    """
+    if len(xs) <= 4 * pixels or x1 <= x0:
+        return np.arange(len(xs))
+    bins = ((np.asarray(xs) - x0) * (pixels / (x1 - x0))).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+    ends = np.r_[starts[1:], len(xs)] - 1
+    # Within each column, by y
+    by_y = np.lexsort((ys, bins))
+    return np.unique(np.concatenate((starts, ends, by_y[starts], by_y[ends])))
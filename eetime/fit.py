@@ -0,0 +1,225 @@
+"""
+Logistic fits of erase curves, many runs at once (stats.py --fit)
+
+    erase_percent = 100 / (1 + exp(-k * (x - x0)))
+
+x is seconds ("logistic") or ln(seconds) ("loglogistic")
+t50 is where the curve crosses 50%, t100 where it crosses T100_PERCENT
+(the model never reaches 100%)
+
+Runs are padded to the same length and fit together with Levenberg-Marquardt:
+every step is a handful of array operations over all runs, each run with its
+own parameters and damping
+Confidence intervals come from the Jacobian at the fit. Reads are not
+independent (the curve is cumulative) so take them as a lower bound
+"""
+
+import math
+import multiprocessing
+import numpy as np
+
+MODELS = ("logistic", "loglogistic")
+T100_PERCENT = 99.9
+# Two sided 95%
+Z95 = 1.959964
+MAX_ITER = 100
+# Runs per batch: bounds memory and lets batches go to workers
+BATCH_RUNS = 256
+
+FIELDS = ("t50", "t50_lo", "t50_hi", "t100", "t100_lo", "t100_hi", "k", "rmse",
+          "n", "converged")
+
+
+def _pad(curves, model):
+    """(x, y, w) (runs, reads) arrays. w is 1 for real points"""
+    size = max([len(ts) for ts, _ps in curves] + [1])
+    x = np.zeros((len(curves), size))
+    y = np.zeros((len(curves), size))
+    w = np.zeros((len(curves), size))
+    for i, (ts, ps) in enumerate(curves):
+        x[i, :len(ts)] = ts
+        y[i, :len(ps)] = ps
+        w[i, :len(ts)] = 1.0
+    if model == "loglogistic":
+        # t = 0 is at -inf, where the model is 0% anyway
+        w[x <= 0] = 0.0
+        x = np.log(np.where(x > 0, x, 1.0))
+    return x, y, w
+
+
+def _crossing(x, y, w, percent):
+    """Interpolated x where each run first reaches percent, nan if never"""
+    above = (y >= percent) & (w > 0)
+    i = np.argmax(above, axis=1)
+    ok = above[np.arange(len(x)), i] & (i > 0)
+    i = np.maximum(i, 1)
+    rows = np.arange(len(x))
+    x0, x1 = x[rows, i - 1], x[rows, i]
+    y0, y1 = y[rows, i - 1], y[rows, i]
+    dy = np.where(y1 > y0, y1 - y0, 1.0)
+    ret = x0 + (percent - y0) * (x1 - x0) / dy
+    return np.where(ok, ret, np.nan)
+
+
+def _initial(x, y, w):
+    """(x0, k) from where the curve crosses 10 / 50 / 90%"""
+    x10 = _crossing(x, y, w, 10.0)
+    x50 = _crossing(x, y, w, 50.0)
+    x90 = _crossing(x, y, w, 90.0)
+    width = x90 - x10
+    # 10% => 90% is 2 ln(9) / k
+    k = 2 * math.log(9) / np.where(width > 0, width, np.nan)
+    # Fall back to the data's span
+    span = np.max(np.where(w > 0, x, -np.inf), axis=1) - np.min(
+        np.where(w > 0, x, np.inf), axis=1)
+    k = np.where(np.isfinite(k), k, 8.0 / np.where(span > 0, span, 1.0))
+    return x50, k
+
+
+def _model(theta, x, jacobian=True):
+    """
+    Model of theta (runs, 2) of x0, k at x
+    With jacobian, also d model / d x0 and d model / d k
+    """
+    x0 = theta[:, 0:1]
+    k = theta[:, 1:2]
+    s = 1.0 / (1.0 + np.exp(-np.clip(k * (x - x0), -500, 500)))
+    if not jacobian:
+        return 100.0 * s
+    ds = 100.0 * s * (1.0 - s)
+    return 100.0 * s, -k * ds, (x - x0) * ds
+
+
+def _normal(j0, j1, w):
+    """J^T J of masked Jacobian columns j0, j1 as its (00, 01, 11) terms"""
+    a00 = np.sum(w * j0 * j0, axis=1)
+    a01 = np.sum(w * j0 * j1, axis=1)
+    a11 = np.sum(w * j1 * j1, axis=1)
+    return a00, a01, a11
+
+
+def _sse(theta, x, y, w):
+    f = _model(theta, x, jacobian=False)
+    return np.sum(w * (y - f)**2, axis=1)
+
+
+def _fit_batch(args):
+    """
+    Levenberg-Marquardt on one batch of padded runs
+    Returns (theta, cov, sse, n, converged)
+    cov: (runs, 2, 2) covariance of x0, k
+    """
+    x, y, w, max_iter = args
+    x0, k = _initial(x, y, w)
+    theta = np.stack((x0, k), axis=-1)
+    # No 50% crossing: nothing to fit
+    active = np.all(np.isfinite(theta), axis=1)
+    theta[~active] = 1.0
+    n = w.sum(axis=1)
+    active &= n > 2
+    lam = np.full(len(x), 1e-3)
+    sse = _sse(theta, x, y, w)
+    converged = np.zeros(len(x), dtype=bool)
+    for _i in range(max_iter):
+        if not active.any():
+            break
+        f, j0, j1 = _model(theta, x)
+        a00, a01, a11 = _normal(j0, j1, w)
+        r = w * (y - f)
+        b0 = np.sum(j0 * r, axis=1)
+        b1 = np.sum(j1 * r, axis=1)
+        # Marquardt: damp the diagonal in proportion to itself
+        a00 = a00 * (1 + lam)
+        a11 = a11 * (1 + lam)
+        det = a00 * a11 - a01 * a01
+        det = np.where(det != 0, det, np.inf)
+        step0 = (a11 * b0 - a01 * b1) / det
+        step1 = (a00 * b1 - a01 * b0) / det
+        step = np.stack((step0, step1), axis=-1)
+        step[~active] = 0.0
+        trial = theta + step
+        trial_sse = _sse(trial, x, y, w)
+        better = active & (trial_sse < sse)
+        # Stop once a step no longer changes anything that matters
+        small = np.all(np.abs(step) <= 1e-9 * np.abs(theta), axis=1)
+        tiny_gain = better & (sse - trial_sse <= 1e-12 * sse)
+        done = active & (small | tiny_gain)
+        theta[better] = trial[better]
+        sse = np.where(better, trial_sse, sse)
+        lam = np.where(better, lam / 10, lam * 10)
+        converged |= done
+        active &= ~done & (lam < 1e12)
+
+    _f, j0, j1 = _model(theta, x)
+    a00, a01, a11 = _normal(j0, j1, w)
+    det = a00 * a11 - a01 * a01
+    det = np.where(det > 0, det, np.nan)
+    sigma2 = sse / np.maximum(n - 2, 1) / det
+    cov = np.empty((len(x), 2, 2))
+    cov[:, 0, 0] = sigma2 * a11
+    cov[:, 0, 1] = cov[:, 1, 0] = -sigma2 * a01
+    cov[:, 1, 1] = sigma2 * a00
+    return theta, cov, sse, n, converged
+
+
+def _batches(order, size):
+    for i in range(0, len(order), size):
+        yield order[i:i + size]
+
+
+def fit_runs(curves,
+             model="logistic",
+             t100_percent=T100_PERCENT,
+             max_iter=MAX_ITER,
+             jobs=1):
+    """
+    curves: (seconds, erase_percent) sequences, one per run
+    jobs: fit batches in this many worker processes
+    Returns {field: array} (see FIELDS), one entry per run
+    Fits that failed (ex: never reached 50%) are nan / not converged
+    """
+    if model not in MODELS:
+        raise ValueError("Unknown model %s" % model)
+    # Similar lengths together so there's little padding
+    order = sorted(range(len(curves)), key=lambda i: len(curves[i][0]))
+    batches = list(_batches(order, BATCH_RUNS))
+    tasks = []
+    for batch in batches:
+        x, y, w = _pad([curves[i] for i in batch], model)
+        tasks.append((x, y, w, max_iter))
+    if jobs > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.map(_fit_batch, tasks)
+    else:
+        results = [_fit_batch(task) for task in tasks]
+
+    ret = dict((k, np.full(len(curves), np.nan)) for k in FIELDS)
+    ret["converged"] = np.zeros(len(curves), dtype=bool)
+    logit100 = math.log(t100_percent / (100.0 - t100_percent))
+    for batch, (theta, cov, sse, n, converged) in zip(batches, results):
+        x0 = theta[:, 0]
+        k = np.where(converged, theta[:, 1], np.nan)
+        x100 = x0 + logit100 / k
+        se50 = np.sqrt(cov[:, 0, 0])
+        # Delta method: d x100 / d (x0, k) = (1, -logit100 / k^2)
+        g = -logit100 / k**2
+        se100 = np.sqrt(cov[:, 0, 0] + 2 * g * cov[:, 0, 1] +
+                        g * g * cov[:, 1, 1])
+        xs = {
+            "t50": x0,
+            "t50_lo": x0 - Z95 * se50,
+            "t50_hi": x0 + Z95 * se50,
+            "t100": x100,
+            "t100_lo": x100 - Z95 * se100,
+            "t100_hi": x100 + Z95 * se100,
+        }
+        for name, v in xs.items():
+            if model == "loglogistic":
+                v = np.exp(v)
+            ret[name][batch] = np.where(converged, v, np.nan)
+        ret["k"][batch] = np.where(converged, k, np.nan)
+        ret["rmse"][batch] = np.where(converged,
+                                      np.sqrt(sse / np.maximum(n, 1)), np.nan)
+        ret["n"][batch] = n
+        ret["converged"][batch] = converged
+    return ret
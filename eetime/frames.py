@@ -0,0 +1,293 @@
+"""
+Frame (device read) storage used by .jl logs
+
+A record that carries a frame says how via "read_meta":
+zlib: zlib compressed then hex encoded into the "read" field (legacy)
+    Old logs omit "read_meta" on the header, which also means zlib
+bin: raw frame in a sidecar file of fixed size records
+    The header names the sidecar ("frames") and record size ("frame_size")
+    Each record gives its byte offset into the sidecar ("read_offset")
+zlib-xor: like zlib, but of the XOR against the previous read record
+    Reads start from a "zlib" keyframe every "keyframe_interval" reads
+    so any frame can be rebuilt without replaying the whole run
+"""
+
+import binascii
+import mmap
+import os
+import zlib
+from .util import tostr
+
+FORMATS = ("jl", "bin", "delta")
+DEFAULT_KEYFRAME_INTERVAL = 32
+
+
+def fw2str(fw):
+    return tostr(binascii.hexlify(zlib.compress(fw)))
+
+
+def str2fw(s):
+    return zlib.decompress(binascii.unhexlify(s))
+
+
+def xor_frames(a, b):
+    if len(a) != len(b):
+        raise ValueError("Frame size mismatch: %u vs %u" % (len(a), len(b)))
+    return (int.from_bytes(a, "little")
+            ^ int.from_bytes(b, "little")).to_bytes(len(a), "little")
+
+
+def sidecar_fn(fn_jl):
+    """Default sidecar for a .jl: iter_01.jl => iter_01.frames.bin"""
+    return os.path.splitext(fn_jl)[0] + ".frames.bin"
+
+
+class FrameStore:
+    """Append only file of fixed size frames, memory mapped for reading"""
+
+    def __init__(self, fn, frame_size, mode="r"):
+        """mode: "r" read, "w" new (truncates), "a" continue an existing one"""
+        assert mode in ("r", "w", "a")
+        self.fn = fn
+        self.frame_size = frame_size
+        self.f = open(fn, mode + "b")
+        self.map = None
+        if mode == "a":
+            # Drop a partial frame left by a crash
+            size = os.fstat(self.f.fileno()).st_size
+            if size % frame_size:
+                self.f.truncate(size - size % frame_size)
+
+    def __len__(self):
+        return os.fstat(self.f.fileno()).st_size // self.frame_size
+
+    def append(self, buf):
+        """Write a frame and return its byte offset"""
+        if len(buf) != self.frame_size:
+            raise ValueError("Expected %u byte frame, got %u" %
+                             (self.frame_size, len(buf)))
+        offset = self.f.seek(0, os.SEEK_END)
+        self.f.write(buf)
+        self.f.flush()
+        return offset
+
+    def sync(self):
+        os.fsync(self.f.fileno())
+
+    def read(self, offset):
+        end = offset + self.frame_size
+        if self.map is None or end > len(self.map):
+            # (Re)map to pick up frames appended since the last read
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+            if end > len(self.map):
+                raise ValueError("Frame @ 0x%X past end of %s" %
+                                 (offset, self.fn))
+        return self.map[offset:end]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.f.close()
+
+
+class Encoder:
+    """
+    Turns a frame into the .jl record fields that store it
+
+    standalone: frame isn't part of the read sequence (ex: header initial read)
+    """
+
+    def __init__(self):
+        # Raw vs written bytes, for the footer
+        self.bytes_raw = 0
+        self.bytes_stored = 0
+
+    def header(self):
+        return {}
+
+    def encode(self, buf, standalone=False):
+        raise NotImplementedError()
+
+    def footer(self):
+        ret = {
+            "frame_bytes": self.bytes_raw,
+            "frame_bytes_stored": self.bytes_stored,
+        }
+        if self.bytes_stored:
+            ret["frame_ratio"] = self.bytes_raw / self.bytes_stored
+        return ret
+
+    def sync(self):
+        """Make frames stored outside the .jl durable"""
+        pass
+
+    def close(self):
+        pass
+
+
+class ZlibEncoder(Encoder):
+    """Frames inline in the .jl (legacy layout)"""
+
+    def encode(self, buf, standalone=False):
+        s = fw2str(buf)
+        self.bytes_raw += len(buf)
+        self.bytes_stored += len(s)
+        return {"read": s, "read_meta": "zlib"}
+
+
+class BinEncoder(Encoder):
+    """Frames in a fixed record size sidecar next to the .jl"""
+
+    def __init__(self, fn_jl, frame_size, mode="w"):
+        """mode: as the .jl's JLWriter, "w" new pass or "a" resume"""
+        Encoder.__init__(self)
+        self.fn = sidecar_fn(fn_jl)
+        self.store = FrameStore(self.fn, frame_size, mode=mode)
+
+    def header(self):
+        return {
+            "frames": os.path.basename(self.fn),
+            "frame_size": self.store.frame_size,
+        }
+
+    def encode(self, buf, standalone=False):
+        self.bytes_raw += len(buf)
+        self.bytes_stored += len(buf)
+        # Sidecar is flushed before the .jl line that points into it
+        return {"read_meta": "bin", "read_offset": self.store.append(buf)}
+
+    def sync(self):
+        self.store.sync()
+
+    def close(self):
+        self.store.close()
+
+
+class DeltaEncoder(Encoder):
+    """Frames inline in the .jl as XOR against the previous read"""
+
+    def __init__(self, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        Encoder.__init__(self)
+        self.keyframe_interval = keyframe_interval
+        self.prev = None
+        # Reads since the last keyframe
+        self.nprev = 0
+
+    def header(self):
+        return {"keyframe_interval": self.keyframe_interval}
+
+    def encode(self, buf, standalone=False):
+        buf = bytes(buf)
+        if standalone or self.prev is None or self.nprev >= self.keyframe_interval:
+            j = {"read": fw2str(buf), "read_meta": "zlib"}
+            if not standalone:
+                self.nprev = 1
+        else:
+            j = {
+                "read": fw2str(xor_frames(self.prev, buf)),
+                "read_meta": "zlib-xor"
+            }
+            self.nprev += 1
+        if not standalone:
+            self.prev = buf
+        self.bytes_raw += len(buf)
+        self.bytes_stored += len(j["read"])
+        return j
+
+
+def header_format(header):
+    """new_encoder() fmt that wrote a .jl, from its header"""
+    if "frames" in header:
+        return "bin"
+    elif "keyframe_interval" in header:
+        return "delta"
+    else:
+        return "jl"
+
+
+def new_encoder(fmt,
+                fn_jl,
+                frame_size,
+                keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                mode="w"):
+    """
+    mode: "w" new .jl, "a" resuming one. A new pass starts a new sidecar so
+        frames of an earlier run in the same directory don't shift offsets
+    """
+    if fmt == "jl":
+        return ZlibEncoder()
+    elif fmt == "bin":
+        return BinEncoder(fn_jl, frame_size, mode=mode)
+    elif fmt == "delta":
+        return DeltaEncoder(keyframe_interval=keyframe_interval)
+    else:
+        raise ValueError("Unknown frame format %s" % (fmt, ))
+
+
+class FrameReader:
+    """
+    Decode frames from any layout for one .jl
+
+    decode() on read records must be called in order for zlib-xor
+    frame() gives random access to a list of read records
+    """
+
+    def __init__(self, fn_jl, header):
+        self.fn_jl = fn_jl
+        self.header = header
+        self.store = None
+        # Last read record decoded: (record, frame)
+        self.prev = None
+
+    def decode(self, j):
+        """Frame carried by record j (header or read), or None"""
+        buf = self._decode(j)
+        if j.get("type") == "read":
+            self.prev = (j, buf)
+        return buf
+
+    def frame(self, reads, n):
+        """Frame of reads[n], replaying from the nearest keyframe"""
+        if self.prev is not None and self.prev[0] is reads[n]:
+            return self.prev[1]
+        start = n
+        while reads[start].get("read_meta") == "zlib-xor":
+            # Keep going from the cached frame if it's on the way
+            if (self.prev is not None and start > 0
+                    and self.prev[0] is reads[start - 1]):
+                break
+            start -= 1
+            if start < 0:
+                raise ValueError("No keyframe before read %u" % (n, ))
+        for i in range(start, n + 1):
+            buf = self.decode(reads[i])
+        return buf
+
+    def _decode(self, j):
+        meta = j.get("read_meta", "zlib")
+        if meta == "zlib":
+            if "read" not in j:
+                return None
+            return str2fw(j["read"])
+        elif meta == "zlib-xor":
+            if self.prev is None:
+                raise ValueError("Delta frame without a previous frame")
+            return xor_frames(self.prev[1], str2fw(j["read"]))
+        elif meta == "bin":
+            if "read_offset" not in j:
+                return None
+            if self.store is None:
+                fn = os.path.join(os.path.dirname(self.fn_jl),
+                                  self.header["frames"])
+                self.store = FrameStore(fn, self.header["frame_size"])
+            return self.store.read(j["read_offset"])
+        else:
+            raise ValueError("Unknown read_meta %s" % (meta, ))
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
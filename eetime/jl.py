@@ -1,30 +1,398 @@
 import json
 import glob
+import hashlib
 import os
+import time
+from . import frames as eframes
 
+INDEX_VERSION = 1
+# JLWriter group commit: fsync every this many records or seconds
+DEFAULT_SYNC_RECORDS = 16
+DEFAULT_SYNC_INTERVAL = 1.0
+# What curve analysis (t50, t100, plots) needs from each read
+CURVE_FIELDS = ("seconds", "erase_percent")
 
-def load_jl(fn):
+
+def strip_read(l):
+    """
+    Replace the (potentially huge) "read" payload of a line with null
+    so that it can be JSON parsed cheaply
+    Works on str or bytes lines. Hex payloads never contain quotes
+    """
+    if isinstance(l, bytes):
+        key = b'"read": "'
+        null = b'"read": null'
+        quote = b'"'
+    else:
+        key = '"read": "'
+        null = '"read": null'
+        quote = '"'
+    start = l.find(key)
+    if start < 0:
+        return l
+    end = l.find(quote, start + len(key))
+    return l[:start] + null + l[end + 1:]
+
+
+def load_jl(fn, frames=False, fields=None):
+    """
+    frames: decode device reads into a "frame" field (bytes) on the header
+        and each read, regardless of how the .jl stored them
+    fields: only keep these keys on each read (ex: ("seconds", "erase_percent"))
+        Frame payloads are skipped without being parsed
+    """
+    if frames and fields is not None:
+        raise ValueError("frames and fields are mutually exclusive")
     header = None
     footer = None
     reads = []
+    reader = None
     for l in open(fn, "r"):
+        if fields is not None:
+            l = strip_read(l)
         j = json.loads(l)
         if j["type"] == "header":
             header = j
             if "sn" in header:
                 header["sn"] = header["sn"].upper()
+            if frames:
+                reader = eframes.FrameReader(fn, header)
+                header["frame"] = reader.decode(header)
         elif j["type"] == "footer":
             footer = j
         elif j["type"] == "read":
+            if reader:
+                j["frame"] = reader.decode(j)
+            if fields is not None:
+                j = {k: j[k] for k in fields if k in j}
             reads.append(j)
         elif j["type"] == "timeout":
             break
         else:
             assert 0, j["type"]
+    if reader:
+        reader.close()
     return header, footer, reads
 
 
-def load_jls_arg(args, ignore_bad=True):
+def decode_frame(fn, header, j):
+    """Device read stored in record j (header or read) of fn, or None"""
+    reader = eframes.FrameReader(fn, header)
+    try:
+        return reader.decode(j)
+    finally:
+        reader.close()
+
+
+def iter_frames(fn, header, reads):
+    """Yield (read, frame) for each read record, decoding as we go"""
+    reader = eframes.FrameReader(fn, header)
+    try:
+        for j in reads:
+            yield j, reader.decode(j)
+    finally:
+        reader.close()
+
+
+def frame_at(fn, header, reads, n):
+    """Frame of reads[n], reconstructing deltas as needed"""
+    reader = eframes.FrameReader(fn, header)
+    try:
+        return reader.frame(reads, n)
+    finally:
+        reader.close()
+
+
+def index_fn(fn):
+    return fn + ".idx"
+
+
+class _LazyReads:
+    """Sequence of read records parsed on access"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, n):
+        return self.index.read(n)
+
+
+class JLIndex:
+    """
+    Byte offset of every record in a .jl so it can be accessed randomly
+    Persisted next to the .jl (iter_01.jl.idx) and extended in place
+    as the .jl grows (ex: a run in progress)
+    """
+
+    def __init__(self, fn, persist=True):
+        self.fn = fn
+        self.persist = persist
+        self.f = open(fn, "rb")
+        self.j = None
+        self._header = None
+        self.update()
+
+    def _new(self):
+        return {
+            "version": INDEX_VERSION,
+            # fn's mtime and size when last scanned
+            "mtime": None,
+            "file_size": None,
+            # Bytes of fn covered by the index (complete lines only)
+            "size": 0,
+            "header_md5": None,
+            "header": None,
+            "footer": None,
+            "timeout": None,
+            "reads": [],
+        }
+
+    def _load(self):
+        try:
+            with open(index_fn(self.fn), "r") as f:
+                j = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if j.get("version") != INDEX_VERSION:
+            return None
+        return j
+
+    def _header_md5(self):
+        self.f.seek(0)
+        return hashlib.md5(self.f.readline()).hexdigest()
+
+    def _save(self):
+        if not self.persist:
+            return
+        tmp = index_fn(self.fn) + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.j, f)
+            os.replace(tmp, index_fn(self.fn))
+        except OSError:
+            # Read only corpus? Index still works, just isn't reused
+            pass
+
+    def update(self):
+        """Pick up (only) lines appended since the index was built"""
+        st = os.fstat(self.f.fileno())
+        if self.j is None and self.persist:
+            self.j = self._load()
+        j = self.j
+        # mtime alone is too coarse: lines completed within the same tick
+        # would be missed
+        if j is not None and j["mtime"] == st.st_mtime and j.get(
+                "file_size") == st.st_size:
+            return
+        # Grew? Must be the same file up to where we left off
+        if j is None or j["size"] > st.st_size or j[
+                "header_md5"] != self._header_md5():
+            j = self._new()
+        self.j = j
+        self._header = None
+
+        self.f.seek(j["size"])
+        offset = j["size"]
+        for l in self.f:
+            if not l.endswith(b"\n"):
+                # Torn / in progress line
+                break
+            rec = json.loads(strip_read(l))
+            t = rec["type"]
+            if t == "read":
+                j["reads"].append(offset)
+            elif t in ("header", "footer", "timeout"):
+                j[t] = offset
+            else:
+                assert 0, t
+            offset += len(l)
+        j["size"] = offset
+        j["mtime"] = st.st_mtime
+        j["file_size"] = st.st_size
+        if j["header_md5"] is None and j["header"] is not None:
+            j["header_md5"] = self._header_md5()
+        self._save()
+
+    def _record(self, offset, fields=None):
+        if offset is None:
+            return None
+        self.f.seek(offset)
+        l = self.f.readline()
+        if fields is not None:
+            l = strip_read(l)
+        j = json.loads(l)
+        if fields is not None:
+            j = {k: j[k] for k in fields if k in j}
+        return j
+
+    def __len__(self):
+        return len(self.j["reads"])
+
+    def header(self):
+        if self._header is None:
+            self._header = self._record(self.j["header"])
+            if self._header and "sn" in self._header:
+                self._header["sn"] = self._header["sn"].upper()
+        return self._header
+
+    def footer(self):
+        return self._record(self.j["footer"])
+
+    def timeout(self):
+        return self._record(self.j["timeout"])
+
+    def read(self, n, fields=None):
+        """Read record n (0 based), optionally only the given fields"""
+        return self._record(self.j["reads"][n], fields=fields)
+
+    def reads(self):
+        """All read records as a lazily parsed sequence"""
+        return _LazyReads(self)
+
+    def frame(self, n):
+        """Device read of read record n"""
+        return frame_at(self.fn, self.header(), self.reads(), n)
+
+    def close(self):
+        self.f.close()
+
+
+def fsync_dir(fn):
+    """Make fn's directory entry (new file, rename) durable"""
+    fd = os.open(os.path.dirname(os.path.abspath(fn)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class JLWriter:
+    """
+    Append records to a .jl with group commit
+
+    Records are written and fsynced together every sync_records records or
+    sync_interval seconds, whichever comes first, instead of flushing
+    every line. A crash loses at most that much, leaving at worst a torn
+    last line (see recover_jl())
+    """
+
+    def __init__(self,
+                 fn,
+                 mode="w",
+                 sync_records=DEFAULT_SYNC_RECORDS,
+                 sync_interval=DEFAULT_SYNC_INTERVAL,
+                 before_sync=None):
+        """
+        mode: "w" new file, "a" continue an existing one
+        before_sync: called before each fsync (ex: to sync a frame sidecar
+            that records point into)
+        """
+        assert mode in ("w", "a")
+        self.fn = fn
+        self.sync_records = sync_records
+        self.sync_interval = sync_interval
+        self.before_sync = before_sync
+        self.f = open(fn, mode)
+        self.pending = 0
+        self.tsync = time.monotonic()
+        if mode == "w":
+            # Make the new directory entry durable too
+            fsync_dir(fn)
+
+    def write(self, j, sync=False):
+        """sync: commit now (ex: header, footer)"""
+        self.f.write(json.dumps(j) + '\n')
+        self.pending += 1
+        if (sync or self.pending >= self.sync_records
+                or time.monotonic() - self.tsync >= self.sync_interval):
+            self.sync()
+
+    def sync(self):
+        if self.before_sync:
+            self.before_sync()
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.pending = 0
+        self.tsync = time.monotonic()
+
+    def close(self):
+        if self.f.closed:
+            return
+        if self.pending:
+            self.sync()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _line_start(f, end, chunk_size=1 << 20):
+    """Offset of the start of the line ending at end (exclusive)"""
+    pos = end
+    while pos > 0:
+        n = min(chunk_size, pos)
+        pos -= n
+        f.seek(pos)
+        i = f.read(n).rfind(b"\n")
+        if i >= 0:
+            return pos + i + 1
+    return 0
+
+
+def last_record(fn):
+    """
+    Last complete record of fn without reading the rest of it
+    None if the file is empty or ends in a partial line (still being written)
+    """
+    with open(fn, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        if not size:
+            return None
+        f.seek(size - 1)
+        if f.read(1) != b"\n":
+            return None
+        start = _line_start(f, size - 1)
+        f.seek(start)
+        return json.loads(strip_read(f.read(size - start)))
+
+
+def recover_jl(fn):
+    """
+    Truncate trailing lines that didn't make it to disk intact
+    (no newline or not valid JSON, ex: after a power cut)
+    Returns bytes removed
+    """
+    with open(fn, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            # Drop anything after the last newline
+            start = _line_start(f, end)
+            if start < end:
+                end = start
+                continue
+            # Last complete line must parse
+            start = _line_start(f, end - 1)
+            f.seek(start)
+            try:
+                json.loads(strip_read(f.read(end - start)))
+                break
+            except ValueError:
+                end = start
+        if end < size:
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+    return size - end
+
+
+def expand_jls_arg(args):
     # accept multiple dirs or individual files
     fns = []
     for fn in args:
@@ -32,9 +400,34 @@ def load_jls_arg(args, ignore_bad=True):
             fns += sorted(list(glob.glob(fn + "/*.jl")))
         else:
             fns += [fn]
+    return sorted(fns)
+
 
-    for fn in sorted(fns):
-        header, footer, reads = load_jl(fn)
+def is_dataset(path):
+    """Columnar export (see eetime.columnar) rather than .jl files"""
+    return path.endswith(".npz") or os.path.exists(
+        os.path.join(path, "runs.parquet"))
+
+
+def load_jls_arg(args, ignore_bad=True, fields=None):
+    """
+    args: .jl files, directories of them and / or columnar exports
+        Exports only have iter, seconds and erase_percent per read
+    """
+    for fn in expand_jls_arg([arg for arg in args if not is_dataset(arg)]):
+        header, footer, reads = load_jl(fn, fields=fields)
         if not footer:
             continue
         yield fn, header, footer, reads
+    for arg in args:
+        if not is_dataset(arg):
+            continue
+        # numpy, only if needed
+        from eetime import columnar
+        dataset = columnar.Dataset(arg)
+        run_fields = fields or columnar.READ_FIELDS
+        for fn in dataset.fns:
+            header, footer, reads = dataset.run(fn, fields=run_fields)
+            if not footer:
+                continue
+            yield fn, header, footer, reads
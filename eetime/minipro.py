@@ -23,17 +23,69 @@ options:
 
 import subprocess
 import os
+import shutil
+import tempfile
+import weakref
 from . import util
 
 
+def tmp_dir():
+    """Prefer tmpfs so that reads don't round trip through the disk"""
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
 class Minipro:
-    def __init__(self, device=None, verbose=False):
+    def __init__(self, device=None, verbose=False, path=None, stdout=False):
+        """
+        path: minipro executable. Pick a different one (ex: a wrapper script)
+            per programmer to use several at once
+        stdout: have minipro write reads to stdout ("-r -") instead of a file
+            Requires a minipro that supports "-" as a file name
+        """
         self.verbose = verbose
-        self.path = os.getenv("MINIPRO", 'minipro')
+        self.path = path or os.getenv("MINIPRO", 'minipro')
         self.device = device
+        self.stdout = stdout
+        # Private dir so concurrent instances can't clobber each other
+        self.tmpdir = tempfile.mkdtemp(prefix="eetime_", dir=tmp_dir())
+        self.read_fn = os.path.join(self.tmpdir, "r.bin")
+        self.write_fn = os.path.join(self.tmpdir, "w.bin")
+        # Reused by read(reuse=True)
+        self.read_buf = None
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self.tmpdir,
+                                         True)
+
+    def close(self):
+        self._cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
-    def subprocess(self, args):
-        if self.verbose:
+    def subprocess(self, args, stdout=None):
+        """
+        stdout: if given, called with the process stdout (a pipe) to consume
+            the output. Messages go to stderr instead
+        """
+        if stdout is not None:
+            with tempfile.TemporaryFile() as messages:
+                subp = subprocess.Popen(
+                    args,
+                    stdout=subprocess.PIPE,
+                    stderr=None if self.verbose else messages,
+                    shell=False)
+                with subp.stdout:
+                    ret = stdout(subp.stdout)
+                subp.wait()
+                if subp.returncode:
+                    messages.seek(0)
+                    self._failed(subp.returncode, messages.read())
+            return ret
+        elif self.verbose:
             subprocess.check_call(args)
         else:
             subp = subprocess.Popen(args,
@@ -42,32 +94,67 @@ class Minipro:
                                     shell=False)
             (stdout, _stderr) = subp.communicate()
             if subp.returncode:
-                print("")
-                print("minipro failed w/ rc %d" % subp.returncode)
-                print(util.tostr(stdout))
-                raise Exception("minipro failed w/ rc %d" % subp.returncode)
+                self._failed(subp.returncode, stdout)
 
-    def read(self, device=None, force=False):
+    def _failed(self, returncode, output):
+        print("")
+        print("minipro failed w/ rc %d" % returncode)
+        print(util.tostr(output))
+        raise Exception("minipro failed w/ rc %d" % returncode)
+
+    def _fill(self, f, reuse, size_hint=None):
+        """Read all of f, into self.read_buf if reuse"""
+        if not reuse:
+            return f.read()
+        buf = self.read_buf
+        if buf is None:
+            buf = bytearray(size_hint or 0)
+        n = 0
+        with memoryview(buf) as view:
+            while n < len(buf):
+                got = f.readinto(view[n:])
+                if not got:
+                    break
+                n += got
+        # First read of a pipe or the size changed
+        rest = f.read()
+        if rest:
+            buf += rest
+        elif n < len(buf):
+            del buf[n:]
+        self.read_buf = buf
+        return buf
+
+    def read(self, device=None, force=False, reuse=False):
+        """
+        reuse: read into a buffer owned by this instance instead of
+            allocating a new one. It is overwritten by the next read(reuse=True)
+            so copy anything that needs to be kept
+        """
         device = device or self.device
         if device is None:
             raise ValueError("Device required")
-        tmpfn = '/tmp/eetime_r.bin'
-        args = [self.path, '-p', device, '-r', tmpfn]
+        args = [self.path, '-p', device, '-r']
+        args.append("-" if self.stdout else self.read_fn)
         if force:
             args.append("-y")
-        self.subprocess(args)
-        with open(tmpfn, 'rb') as f:
-            code = f.read()
+        if self.stdout:
+            code = self.subprocess(args, stdout=lambda f: self._fill(f, reuse))
+        else:
+            self.subprocess(args)
+            with open(self.read_fn, 'rb') as f:
+                code = self._fill(f,
+                                  reuse,
+                                  size_hint=os.fstat(f.fileno()).st_size)
         return {"code": code}
 
     def write(self, code, device=None, force=False, verify=True):
         device = device or self.device
         if device is None:
             raise ValueError("Device required")
-        tmpfn = '/tmp/eetime_w.bin'
-        with open(tmpfn, 'wb') as f:
+        with open(self.write_fn, 'wb') as f:
             f.write(code)
-        args = [self.path, '-p', device, '-w', tmpfn]
+        args = [self.path, '-p', device, '-w', self.write_fn]
         if not verify:
             args.append("--skip_verify")
         if force:
@@ -0,0 +1,195 @@
+"""
+Read scheduling for the collector
+"""
+
+import queue
+import threading
+import time
+
+# Target erase_percent change between adaptive reads
+DEFAULT_ADAPT_STEP = 1.0
+# Max factor the adaptive interval may grow by per read
+DEFAULT_ADAPT_GROWTH = 2.0
+
+
+class AdaptiveInterval:
+    """
+    Pick the next read interval from how fast erase_percent is moving
+
+    Aims for about step percent change between reads, clamped to
+    [interval_min, interval_max]
+    Static stretches (0% plateau, 100% tail) drift up to interval_max, growing
+    at most growth x per read so the start of the erase isn't overshot.
+    Once the curve moves the interval drops right away
+    """
+    def __init__(self,
+                 interval_min,
+                 interval_max,
+                 start=None,
+                 step=DEFAULT_ADAPT_STEP,
+                 growth=DEFAULT_ADAPT_GROWTH):
+        if interval_min > interval_max:
+            raise ValueError("interval_min > interval_max")
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.step = step
+        self.growth = growth
+        if start is None:
+            start = interval_max
+        self.interval = self.clamp(start)
+        self.prev = None
+
+    def clamp(self, interval):
+        return min(self.interval_max, max(self.interval_min, interval))
+
+    def header(self):
+        return {
+            "interval_min": self.interval_min,
+            "interval_max": self.interval_max,
+            "adapt_step": self.step,
+        }
+
+    def next(self, seconds, erase_percent):
+        """Record a read, return seconds until the next one"""
+        if self.prev is not None:
+            dt = seconds - self.prev[0]
+            dp = abs(erase_percent - self.prev[1])
+            # Slowest allowed change. dt also covers the read time, which
+            # matters for interval_min = 0
+            want = max(self.interval, dt) * self.growth
+            if dp > 0 and dt > 0:
+                want = min(want, self.step * dt / dp)
+            self.interval = self.clamp(want)
+        self.prev = (seconds, erase_percent)
+        return self.interval
+
+
+class FrameLock:
+    """
+    Deadline based read schedule on the monotonic clock
+
+    Each slot is interval after the previous slot, not after the previous
+    read finished, so read time doesn't accumulate as drift
+    A read that runs past the next slot is an overrun: the schedule restarts
+    from now instead of bursting reads to catch up
+    """
+
+    def __init__(self, label="", log=True):
+        """log: print a WARNING on each overrun"""
+        self.label = label
+        self.log = log
+        self.deadline = None
+        self.overruns = 0
+        self.overrun_max = 0.0
+
+    def wait(self, interval, stop=None):
+        """
+        Sleep until the next slot (none for the first call)
+        stop: threading.Event that ends the wait early
+        Returns time.monotonic() at wake up
+        """
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+            return now
+        self.deadline += interval
+        late = now - self.deadline
+        if late > 0:
+            if interval > 0:
+                self.overruns += 1
+                self.overrun_max = max(self.overrun_max, late)
+                if self.log:
+                    print(
+                        "%sWARNING: overran %0.3f sec interval by %0.3f sec" %
+                        (self.label, interval, late))
+            self.deadline = now
+            return now
+        if stop is not None:
+            stop.wait(-late)
+        else:
+            time.sleep(-late)
+        return time.monotonic()
+
+    def footer(self):
+        return {
+            "overruns": self.overruns,
+            "overrun_max": self.overrun_max,
+        }
+
+
+class PipelinedReader:
+    """
+    Run a read iterator in a background thread, queueing up to depth items
+
+    Keeps slow consumer work (scoring, compression, log writes) from delaying
+    the next read. If the consumer falls behind the queue fills and the
+    reader blocks: each time is counted as a stall and reported
+    """
+    _END = object()
+
+    def __init__(self, reads, depth, stop, label=""):
+        """
+        reads: iterator to run in the thread
+        stop: threading.Event the iterator checks to end early
+        """
+        self.reads = reads
+        self.depth = depth
+        self.stop = stop
+        self.label = label
+        self.queue = queue.Queue(maxsize=depth)
+        self.depth_max = 0
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.stalls += 1
+            print("%sWARNING: read pipeline full (%u), consumer behind" %
+                  (self.label, self.depth))
+            tstart = time.time()
+            self.queue.put(item)
+            self.stall_time += time.time() - tstart
+        self.depth_max = max(self.depth_max, self.queue.qsize())
+
+    def _run(self):
+        try:
+            for item in self.reads:
+                self._put((item, None))
+                if self.stop.is_set():
+                    break
+        except Exception as e:
+            self._put((self._END, e))
+            return
+        self._put((self._END, None))
+
+    def __iter__(self):
+        while True:
+            item, exception = self.queue.get()
+            if item is self._END:
+                if exception is not None:
+                    raise exception
+                return
+            yield item
+
+    def close(self):
+        """Stop reading and wait for any in progress read to finish"""
+        self.stop.set()
+        while self.thread.is_alive():
+            # Unblock the reader if its waiting on a full queue
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.thread.join()
+
+    def footer(self):
+        return {
+            "pipeline_depth": self.depth,
+            "pipeline_depth_max": self.depth_max,
+            "pipeline_stalls": self.stalls,
+            "pipeline_stall_time": self.stall_time,
+        }
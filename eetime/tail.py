@@ -0,0 +1,83 @@
+"""
+Follow growing .jl files (monitor.py)
+
+Only bytes appended since the last poll are read and parsed. Read payloads are
+stripped before parsing (see jl.strip_read()) so the cost per record doesn't
+depend on the device size
+"""
+
+import json
+import os
+from eetime.jl import strip_read
+
+READ_CHUNK = 1 << 20
+# Catching up on a big existing file is spread over several polls so other
+# files followed by the same loop (monitor.py stations) keep updating
+POLL_BYTES = 16 << 20
+
+
+class JLTail:
+    def __init__(self, fn, poll_bytes=POLL_BYTES):
+        """poll_bytes: read at most about this much per poll()"""
+        self.fn = fn
+        self.poll_bytes = poll_bytes
+        # Bytes consumed, including self.partial
+        self.offset = 0
+        # Start of a line that hasn't been fully written yet
+        self.partial = b""
+        self.ino = None
+        # time.time() the file was last written, as of the last poll
+        self.mtime = None
+
+    def poll(self):
+        """
+        (reset, records) for lines completed since the last poll
+        reset: the file was replaced or truncated (ex: collect.py --resume
+        dropping a torn line) and records start over from the beginning
+        """
+        try:
+            st = os.stat(self.fn)
+        except FileNotFoundError:
+            return False, []
+        reset = False
+        if self.ino is not None and (st.st_ino != self.ino
+                                     or st.st_size < self.offset):
+            self.offset = 0
+            self.partial = b""
+            reset = True
+        self.ino = st.st_ino
+        self.mtime = st.st_mtime
+        if st.st_size == self.offset:
+            return reset, []
+
+        records = []
+        with open(self.fn, "rb") as f:
+            f.seek(self.offset)
+            budget = self.poll_bytes
+            while self.offset < st.st_size and budget > 0:
+                buf = f.read(min(READ_CHUNK, st.st_size - self.offset))
+                if not buf:
+                    break
+                self.offset += len(buf)
+                budget -= len(buf)
+                end = buf.rfind(b"\n") + 1
+                if not end:
+                    # Still in the middle of a (long) line
+                    self.partial += buf
+                    continue
+                records += self._parse(self.partial + buf[:end])
+                self.partial = buf[end:]
+        return reset, records
+
+    def _parse(self, buf):
+        """Records of complete lines buf"""
+        records = []
+        for l in buf.splitlines():
+            if not l.strip():
+                continue
+            try:
+                records.append(json.loads(strip_read(l)))
+            except ValueError:
+                # Torn by a crash, recover_jl() would drop it
+                pass
+        return records
@@ -0,0 +1,81 @@
+"""
+Where the time goes in each collector iteration (collect.py --timing)
+
+All timestamps are time.monotonic()
+"""
+
+# read: minipro, including process spawn
+# write: .jl record, so only known after the record is written
+STAGES = ("read", "score", "encode", "hash", "write")
+
+
+def percentile(xs, p):
+    """Nearest rank percentile of sorted xs"""
+    if not xs:
+        return 0.0
+    return xs[min(len(xs) - 1, int(p / 100.0 * len(xs)))]
+
+
+class ReadTimer:
+    def __init__(self, tstart):
+        """tstart: monotonic time the pass started"""
+        self.tstart = tstart
+        self.durations = dict((stage, []) for stage in STAGES)
+        # Read start spacing beyond the nominal interval
+        self.lates = []
+        self.missed = 0
+        self.prev_start = None
+
+    def read(self, start, end, interval):
+        """
+        Record a read that ran from start to end, interval after the previous
+        Returns its record fields
+        """
+        self.durations["read"].append(end - start)
+        if self.prev_start is not None:
+            spacing = start - self.prev_start
+            self.lates.append(spacing - interval)
+            if interval > 0:
+                self.missed += max(0, int(spacing / interval) - 1)
+        self.prev_start = start
+        return {
+            "t_read_start": start - self.tstart,
+            "t_read_end": end - self.tstart,
+        }
+
+    def stage(self, stage, dt):
+        self.durations[stage].append(dt)
+
+    def stages(self, stages):
+        """Record fields for durations of stages (names)"""
+        durations = {}
+        for stage in stages:
+            durations[stage] = self.durations[stage][-1]
+        return {"stages": durations}
+
+    def summary(self):
+        """{name: (mean, p50, p99)} for each stage and lateness"""
+        ret = {}
+        items = list(self.durations.items()) + [("late", self.lates)]
+        for name, xs in items:
+            if not xs:
+                continue
+            xs = sorted(xs)
+            mean = sum(xs) / len(xs)
+            ret[name] = (mean, percentile(xs, 50), percentile(xs, 99))
+        return ret
+
+    def footer(self):
+        ret = {"timing_missed_intervals": self.missed}
+        for name, (mean, p50, p99) in self.summary().items():
+            ret["timing_%s_mean" % name] = mean
+            ret["timing_%s_p50" % name] = p50
+            ret["timing_%s_p99" % name] = p99
+        return ret
+
+    def print_summary(self, label=""):
+        print("%sTiming (ms)     mean      p50      p99" % label)
+        for name, (mean, p50, p99) in self.summary().items():
+            print("%s  %-8s %8.1f %8.1f %8.1f" %
+                  (label, name, mean * 1e3, p50 * 1e3, p99 * 1e3))
+        print("%s  missed intervals: %u" % (label, self.missed))
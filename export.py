@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Export a .jl corpus to a columnar dataset (see eetime.columnar)
+
+stats.py, plot.py and csv_runs.py then read the export instead of parsing
+every .jl:
+    ./export.py db/prod db/prod.npz
+    ./csv_runs.py --dataset db/prod.npz db/prod
+"""
+
+import argparse
+import time
+import eetime.jl
+from eetime import columnar
+from csv_runs import find_jl_dirs
+
+
+def run(paths, out, frames=False, verbose=False):
+    fns = []
+    for path in paths:
+        if path.endswith(".jl"):
+            fns.append(path)
+        else:
+            for d in find_jl_dirs(path):
+                fns += eetime.jl.expand_jls_arg([d])
+    tstart = time.time()
+    cols = columnar.build(fns, frames=frames, verbose=verbose)
+    columnar.save(cols, out)
+    print("Exported %u runs, %u reads to %s in %0.1f sec" %
+          (len(fns), len(cols["seconds"]), out, time.time() - tstart))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export .jl runs to a columnar dataset")
+    parser.add_argument('--frames',
+                        action="store_true",
+                        help='Include every read frame (large)')
+    parser.add_argument('--verbose', action="store_true")
+    parser.add_argument('paths',
+                        nargs="+",
+                        help='.jl files or directories to search for them')
+    parser.add_argument(
+        'out', help='.npz, or a directory for Parquet (requires pyarrow)')
+    args = parser.parse_args()
+
+    run(args.paths, args.out, frames=args.frames, verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    main()
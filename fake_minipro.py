@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the minipro executable with a simulated UV erase
+Lets collect.py etc run without a programmer:
+
+    MINIPRO=./fake_minipro.py ./collect.py --device 27C256@DIP28 --write-init
+
+Supports -p, -r (file or -), -w. Other minipro flags are ignored
+
+Every bit erases (reads 1) at its own time: t50 * (u / (1 - u)) ** spread,
+u uniform per bit. So the erased fraction is a sigmoid in log time centered
+on t50: nothing is erased at t = 0 and the slowest bit is about
+t50 * 1.5 with the default spread
+The clock starts at the last -w, or the first call for a device never written
+(the chip starts out all 0)
+
+Each simulated chip is keyed by device and instance, the name fake_minipro
+was run as. Symlink it under other names to simulate several programmers
+(ex: one per collect.py --station), even with the same part in each
+
+Configured by environment:
+    EETIME_FAKE_T50: seconds to 50% erased (default 120)
+    EETIME_FAKE_SPREAD: bit to bit erase time spread (default 0.035)
+    EETIME_FAKE_LATENCY: extra seconds per read (default 0)
+    EETIME_FAKE_SIZE: device size in bytes (default: from the device name)
+    EETIME_FAKE_SEED: changes which bits are fast / slow (default 0)
+    EETIME_FAKE_INSTANCE: programmer instance (default: executable name)
+    EETIME_FAKE_STATE: state directory. Delete to reset
+        (default eetime_fake_minipro in tmpfs)
+"""
+
+import json
+import math
+import os
+import random
+import re
+import sys
+import time
+from eetime.minipro import tmp_dir
+
+DEFAULT_T50 = 120.0
+DEFAULT_SPREAD = 0.035
+# 27C<name> => Mbit, for names that are not Kbit
+MBIT_NAMES = {
+    "010": 1,
+    "020": 2,
+    "040": 4,
+    "080": 8,
+    "1001": 1,
+    "2001": 2,
+    "4001": 4,
+    "8001": 8,
+    "160": 16,
+    "322": 32,
+}
+
+
+def device_size(device):
+    """Bytes in a 27xxx style part: 27C256@DIP28 => 32768"""
+    m = re.search(r"27C?(\d+)", device.upper())
+    if not m:
+        raise ValueError("Can't guess size of %s, set EETIME_FAKE_SIZE" %
+                         device)
+    name = m.group(1)
+    if name in MBIT_NAMES:
+        return MBIT_NAMES[name] * 1024 * 1024 // 8
+    return int(name) * 1024 // 8
+
+
+def getenv_float(name, default):
+    return float(os.getenv(name, default))
+
+
+def default_instance():
+    return os.getenv("EETIME_FAKE_INSTANCE",
+                     os.path.splitext(os.path.basename(sys.argv[0]))[0])
+
+
+class FakeEprom:
+    def __init__(self, device, state_dir=None, instance=None):
+        self.device = device
+        self.instance = instance or default_instance()
+        size = os.getenv("EETIME_FAKE_SIZE")
+        self.size = int(size, 0) if size else device_size(device)
+        self.t50 = getenv_float("EETIME_FAKE_T50", DEFAULT_T50)
+        self.spread = getenv_float("EETIME_FAKE_SPREAD", DEFAULT_SPREAD)
+        self.seed = os.getenv("EETIME_FAKE_SEED", "0")
+        if state_dir is None:
+            state_dir = os.getenv(
+                "EETIME_FAKE_STATE",
+                os.path.join(tmp_dir(), "eetime_fake_minipro"))
+        os.makedirs(state_dir, exist_ok=True)
+        key = re.sub(r"[^A-Za-z0-9_.-]", "_",
+                     "%s_%s" % (self.instance, device))
+        self.json_fn = os.path.join(state_dir, key + ".json")
+        self.bin_fn = os.path.join(state_dir, key + ".bin")
+
+    def _state(self):
+        """(t0, programmed image)"""
+        try:
+            with open(self.json_fn, "r") as f:
+                t0 = json.load(f)["t0"]
+            with open(self.bin_fn, "rb") as f:
+                image = f.read()
+            if len(image) == self.size:
+                return t0, image
+        except (OSError, ValueError, KeyError):
+            pass
+        image = bytes(self.size)
+        self.write(image)
+        return self._state()
+
+    def write(self, image):
+        if len(image) != self.size:
+            raise ValueError("Expected %u bytes, got %u" %
+                             (self.size, len(image)))
+        with open(self.bin_fn + ".tmp", "wb") as f:
+            f.write(image)
+        os.replace(self.bin_fn + ".tmp", self.bin_fn)
+        with open(self.json_fn + ".tmp", "w") as f:
+            json.dump({"t0": time.time()}, f)
+        os.replace(self.json_fn + ".tmp", self.json_fn)
+
+    def erased_fraction(self, t):
+        if t <= 0:
+            return 0.0
+        x = math.log(t / self.t50) / self.spread
+        # Avoid exp() overflow far from t50
+        if x > 50:
+            return 1.0
+        if x < -50:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(-x))
+
+    def erased_mask(self, t):
+        """Bits erased t seconds after programming, as an int"""
+        # Erased iff the bit's 16 bit uniform value < level
+        # Round so that the first / last values aren't special
+        level = int(self.erased_fraction(t) * 0x10000 + 0.5)
+        if level == 0:
+            return 0
+        if level >= 0x10000:
+            return (1 << (8 * self.size)) - 1
+        hi_level, lo_level = level >> 8, level & 0xFF
+        mask = 0
+        for biti in range(8):
+            # Uniform value of this bit position in every byte
+            rng = random.Random("%s/%s/%s/%u" %
+                                (self.seed, self.instance, self.device, biti))
+            his = rng.randbytes(self.size)
+            los = rng.randbytes(self.size)
+            bit = 1 << biti
+            lt_hi = bytes(bit if v < hi_level else 0 for v in range(256))
+            eq_hi = bytes(bit if v == hi_level else 0 for v in range(256))
+            lt_lo = bytes(bit if v < lo_level else 0 for v in range(256))
+            mask |= int.from_bytes(his.translate(lt_hi), "little")
+            mask |= (int.from_bytes(his.translate(eq_hi), "little")
+                     & int.from_bytes(los.translate(lt_lo), "little"))
+        return mask
+
+    def read(self):
+        t0, image = self._state()
+        t = time.time() - t0
+        code = int.from_bytes(image, "little") | self.erased_mask(t)
+        time.sleep(getenv_float("EETIME_FAKE_LATENCY", 0.0))
+        return code.to_bytes(self.size, "little")
+
+
+def main(argv):
+    if "-p" not in argv:
+        print("fake_minipro: -p <device> required", file=sys.stderr)
+        return 1
+    eprom = FakeEprom(argv[argv.index("-p") + 1])
+    if "-r" in argv:
+        fn = argv[argv.index("-r") + 1]
+        code = eprom.read()
+        if fn == "-":
+            sys.stdout.buffer.write(code)
+        else:
+            with open(fn, "wb") as f:
+                f.write(code)
+    elif "-w" in argv:
+        with open(argv[argv.index("-w") + 1], "rb") as f:
+            eprom.write(f.read())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
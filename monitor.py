@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Live view of collect.py runs in progress
+
+    ./monitor.py log/2022-03-19_01_intel_d27c256
+    ./monitor.py --http 8080 log/station_run
+
+Every directory with .jl files at or below the arguments is a station; its
+newest .jl is followed by byte offset (see eetime.tail) so each poll only
+parses what was appended
+t50 / t100 are observed once reached, before that estimated from a running
+logistic fit (logit(erase_percent) is linear in time, see eetime.fit)
+"""
+
+import argparse
+import collections
+import json
+import math
+import threading
+import time
+import eetime.jl
+from eetime.tail import JLTail
+from csv_runs import find_jl_dirs
+
+# eetime.fit.T100_PERCENT, without importing numpy
+T100_PERCENT = 99.9
+# Only fit points clear of the 0 / 100% ends
+FIT_MIN_PERCENT = 1.0
+FIT_MAX_PERCENT = 99.0
+# Reads to average the read rate over
+RATE_READS = 20
+# No new read for this many intervals (and at least STALL_MIN seconds)
+STALL_INTERVALS = 3
+STALL_MIN = 10.0
+# Reads this much further apart than the interval on average
+SLOW_RATIO = 1.5
+
+
+def logit(percent):
+    p = percent / 100.0
+    return math.log(p / (1.0 - p))
+
+
+class Station:
+    """What is known about one run (.jl), updated one record at a time"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.header = None
+        self.footer = None
+        self.timeout = False
+        self.iter = 0
+        self.seconds = 0.0
+        self.erase_percent = 0.0
+        self.t50 = None
+        # Start of the current erased streak
+        self.t100 = None
+        self.interval = None
+        self.gaps = collections.deque(maxlen=RATE_READS)
+        # Least squares of logit(erase_percent) vs seconds
+        self.fit_n = 0
+        self.fit_t = 0.0
+        self.fit_tt = 0.0
+        self.fit_z = 0.0
+        self.fit_tz = 0.0
+        # time.monotonic() the last record was written (not read: the first
+        # poll replays everything written before monitor.py started)
+        self.updated = time.monotonic()
+
+    def add(self, j, updated=None):
+        """updated: when j was written (time.monotonic()), default now"""
+        self.updated = time.monotonic() if updated is None else updated
+        if j["type"] == "header":
+            self.header = j
+            self.interval = j.get("interval")
+        elif j["type"] == "footer":
+            self.footer = j
+        elif j["type"] == "timeout":
+            self.timeout = True
+        elif j["type"] == "read":
+            self.add_read(j)
+
+    def add_read(self, j):
+        seconds = j["seconds"]
+        percent = j["erase_percent"]
+        if self.iter:
+            self.gaps.append(seconds - self.seconds)
+        if self.t50 is None and percent >= 50.0:
+            self.t50 = seconds
+            if self.erase_percent < 50.0 and percent > self.erase_percent:
+                # Interpolate between this and the previous read
+                self.t50 = self.seconds + (50.0 - self.erase_percent) * (
+                    seconds - self.seconds) / (percent - self.erase_percent)
+        if j.get("erased"):
+            if self.t100 is None:
+                self.t100 = seconds
+        else:
+            self.t100 = None
+        if FIT_MIN_PERCENT < percent < FIT_MAX_PERCENT:
+            z = logit(percent)
+            self.fit_n += 1
+            self.fit_t += seconds
+            self.fit_tt += seconds * seconds
+            self.fit_z += z
+            self.fit_tz += seconds * z
+        # Adaptive interval: nominal time since the previous read
+        self.interval = j.get("interval", self.interval)
+        self.iter = j["iter"]
+        self.seconds = seconds
+        self.erase_percent = percent
+
+    def fit_time(self, percent):
+        """Seconds at which the running fit reaches percent, None if unknown"""
+        if self.fit_n < 2:
+            return None
+        n = self.fit_n
+        det = n * self.fit_tt - self.fit_t * self.fit_t
+        if det <= 0:
+            return None
+        k = (n * self.fit_tz - self.fit_t * self.fit_z) / det
+        if k <= 0:
+            return None
+        c = (self.fit_z - k * self.fit_t) / n
+        return (logit(percent) - c) / k
+
+    def read_rate(self):
+        """Reads per minute over the last RATE_READS reads"""
+        if not self.gaps or sum(self.gaps) <= 0:
+            return None
+        return 60.0 * len(self.gaps) / sum(self.gaps)
+
+    def health(self, now):
+        if self.timeout:
+            return "timeout"
+        if self.footer:
+            return "done"
+        if not self.iter:
+            return "waiting"
+        interval = self.interval or 0.0
+        since = now - self.updated
+        if since > max(STALL_INTERVALS * interval, STALL_MIN):
+            return "stalled"
+        rate = self.read_rate()
+        if rate and interval and 60.0 / rate > SLOW_RATIO * interval:
+            return "slow"
+        return "ok"
+
+    def summary(self, now):
+        """Plain JSON state"""
+        health = self.health(now)
+        # Run time now, not as of the last read, if it's still going
+        elapsed = self.seconds
+        if health in ("ok", "slow"):
+            elapsed += now - self.updated
+        j = {
+            "fn": self.fn,
+            "sn": (self.header or {}).get("sn"),
+            "prog_dev": (self.header or {}).get("prog_dev"),
+            "iter": self.iter,
+            "seconds": self.seconds,
+            "erase_percent": self.erase_percent,
+            "health": health,
+            "reads_per_min": self.read_rate(),
+            "interval": self.interval,
+        }
+        for name, observed, percent in (("t50", self.t50, 50.0),
+                                        ("t100", self.t100, T100_PERCENT)):
+            j[name] = observed
+            j[name + "_estimate"] = None
+            j[name + "_eta"] = None
+            if observed is None:
+                estimate = self.fit_time(percent)
+                j[name + "_estimate"] = estimate
+                if estimate is not None:
+                    j[name + "_eta"] = max(0.0, estimate - elapsed)
+        return j
+
+
+class Monitor:
+    def __init__(self, paths, rescan=5.0):
+        """
+        paths: .jl files or directories to find stations in
+        rescan: look for new stations / passes this often (seconds)
+        """
+        self.paths = paths
+        self.rescan = rescan
+        self.last_scan = None
+        # station (dir or .jl) => (JLTail, Station)
+        self.stations = {}
+        self.lock = threading.Lock()
+
+    def scan(self):
+        """Follow the newest .jl of every station"""
+        for path in self.paths:
+            if path.endswith(".jl"):
+                self.follow(path, path)
+                continue
+            for d in find_jl_dirs(path):
+                fns = eetime.jl.expand_jls_arg([d])
+                if fns:
+                    self.follow(d, fns[-1])
+
+    def follow(self, key, fn):
+        if key in self.stations and self.stations[key][0].fn == fn:
+            return
+        with self.lock:
+            self.stations[key] = (JLTail(fn), Station(fn))
+
+    def poll(self):
+        now = time.monotonic()
+        if self.last_scan is None or now - self.last_scan >= self.rescan:
+            self.scan()
+            self.last_scan = now
+        for key, (tail, station) in list(self.stations.items()):
+            reset, records = tail.poll()
+            if records:
+                # File's mtime on the monotonic clock: when the last of
+                # records was written
+                age = max(0.0, time.time() - tail.mtime)
+                updated = time.monotonic() - age
+            with self.lock:
+                if reset:
+                    station = Station(tail.fn)
+                    self.stations[key] = (tail, station)
+                for j in records:
+                    station.add(j, updated=updated)
+
+    def summaries(self):
+        now = time.monotonic()
+        with self.lock:
+            return [
+                station.summary(now)
+                for _key, (_tail, station) in sorted(self.stations.items())
+            ]
+
+
+def format_time(j, name):
+    if j[name] is not None:
+        return "%0.1f" % j[name]
+    if j[name + "_eta"] is not None:
+        return "~%0.0f (%0.0fs)" % (j[name + "_estimate"], j[name + "_eta"])
+    return "-"
+
+
+def print_summaries(summaries):
+    print("%-40s %6s %7s %16s %16s %9s %s" %
+          ("run", "iter", "erased", "t50 (eta)", "t100 (eta)", "reads/min",
+           "health"))
+    for j in summaries:
+        rate = "-"
+        if j["reads_per_min"] is not None:
+            rate = "%0.1f" % j["reads_per_min"]
+        t50 = format_time(j, "t50")
+        t100 = format_time(j, "t100")
+        print("%-40s %6u %6.1f%% %16s %16s %9s %s" %
+              (j["fn"][-40:], j["iter"], j["erase_percent"], t50, t100, rate,
+               j["health"]))
+
+
+def serve(monitor, port, host="127.0.0.1"):
+    """JSON summaries at http://host:port/ from a background thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/stations"):
+                self.send_error(404)
+                return
+            body = json.dumps(monitor.summaries()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print("Serving on http://%s:%u/" % (host, port))
+    return server
+
+
+def run(paths,
+        period=2.0,
+        rescan=5.0,
+        once=False,
+        http_port=None,
+        quiet=False):
+    monitor = Monitor(paths, rescan=rescan)
+    if http_port is not None:
+        serve(monitor, http_port)
+    while True:
+        monitor.poll()
+        if not quiet:
+            print("")
+            print_summaries(monitor.summaries())
+        if once:
+            break
+        time.sleep(period)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Follow collect.py runs in progress")
+    parser.add_argument('--period',
+                        type=float,
+                        default=2.0,
+                        help='Seconds between updates')
+    parser.add_argument('--rescan',
+                        type=float,
+                        default=5.0,
+                        help='Look for new stations / passes this often')
+    parser.add_argument('--once',
+                        action="store_true",
+                        help='Print one update and exit')
+    parser.add_argument('--http',
+                        type=int,
+                        default=None,
+                        help='Also serve JSON status on this local port')
+    parser.add_argument('--quiet',
+                        action="store_true",
+                        help="Don't print updates (ex: with --http)")
+    parser.add_argument('paths',
+                        nargs="+",
+                        help='.jl files or directories to look around in')
+    args = parser.parse_args()
+
+    try:
+        run(args.paths,
+            period=args.period,
+            rescan=args.rescan,
+            once=args.once,
+            http_port=args.http,
+            quiet=args.quiet)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,141 @@
 #!/usr/bin/env python3
+"""
+Overlay erase curves
+
+All runs are drawn as one LineCollection, each curve decimated to the plot's
+pixel width. .jl curves are cached next to them (see eetime.curves)
+--save renders with Agg without importing pyplot / an interactive backend
+"""
 
 import argparse
-import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression
-import numpy as np
-import scipy.optimize
-from scipy.optimize import curve_fit
-import json
-import glob
-import os
 import eetime.jl
 
+# Legend every run up to this many, otherwise only groups
+MAX_RUN_LEGEND = 10
+
+
+def load_runs(args, rebuild=False):
+    """
+    (fn, header, seconds, erase_percent) for complete runs in args
+    args: .jl files, directories of them and / or columnar exports
+    """
+    from eetime import curves
+
+    ret = []
+    for fn in eetime.jl.expand_jls_arg(
+        [arg for arg in args if not eetime.jl.is_dataset(arg)]):
+        header, footer, seconds, percent = curves.load_curve(fn,
+                                                             rebuild=rebuild)
+        if footer:
+            ret.append((fn, header, seconds, percent))
+    for arg in args:
+        if not eetime.jl.is_dataset(arg):
+            continue
+        from eetime import columnar
+        dataset = columnar.Dataset(arg)
+        for fn in dataset.fns:
+            if dataset.footer(fn):
+                ret.append(
+                    (fn, dataset.header(fn), dataset.column(fn, "seconds"),
+                     dataset.column(fn, "erase_percent")))
+    return ret
+
+
+def group_runs(runs, color_by=None):
+    """(label of each run, labels in legend order)"""
+    if not color_by:
+        labels = [str(runi) for runi in range(len(runs))]
+        return labels, labels
+    labels = [str(header.get(color_by, "")) for _fn, header, _s, _p in runs]
+    return labels, sorted(set(labels))
+
+
+def group_colors(groups):
+    """group => color"""
+    import matplotlib
 
-def decode(reads):
-    times = []
-    percentages = []
-    for aread in reads:
-        times.append(aread["seconds"])
-        percentages.append(aread["erase_percent"])
-    return times, percentages
+    if len(groups) <= 10:
+        cmap = matplotlib.colormaps["tab10"]
+        return dict((group, cmap(i)) for i, group in enumerate(groups))
+    cmap = matplotlib.colormaps["turbo"]
+    scale = len(groups) - 1
+    return dict((group, cmap(i / scale)) for i, group in enumerate(groups))
+
+
+def render(fig, runs, color_by=None, title=None):
+    """Draw runs on a new axes of fig"""
+    import numpy as np
+    from matplotlib.collections import LineCollection
+    from matplotlib.lines import Line2D
+    from eetime import curves
+
+    ax = fig.add_subplot()
+    ax.set_xlabel("t (sec)")
+    ax.set_ylabel("% erased")
+    if title is None:
+        prog_devs = set(header.get("prog_dev") for _fn, header, _s, _p in runs)
+        title = "%u runs" % len(runs)
+        if len(prog_devs) == 1:
+            title = prog_devs.pop()
+    ax.set_title(title)
+
+    labels, groups = group_runs(runs, color_by=color_by)
+    colors = group_colors(groups)
+    xmax = 1.0
+    for _fn, _header, seconds, _percent in runs:
+        if len(seconds):
+            xmax = max(xmax, float(seconds[-1]))
+    pixels = max(1, int(ax.get_window_extent().width))
+    segments = []
+    for _fn, _header, seconds, percent in runs:
+        keep = curves.decimate(seconds, percent, 0.0, xmax, pixels)
+        segments.append(np.column_stack((seconds[keep], percent[keep])))
+    lines = LineCollection(segments,
+                           colors=[colors[label] for label in labels],
+                           linewidths=1.0)
+    ax.add_collection(lines)
+    ax.set_xlim(0, xmax * 1.02)
+    ax.set_ylim(-2, 102)
+
+    if color_by or len(runs) <= MAX_RUN_LEGEND:
+        handles = [Line2D([], [], color=colors[group]) for group in groups]
+        ax.legend(handles, groups, title=color_by)
+    return ax
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Help')
-    parser.add_argument('--save', default=None)
-    parser.add_argument('jls', nargs="+", help='')
+    parser = argparse.ArgumentParser(description='Overlay erase curves')
+    parser.add_argument('--save', default=None, help='Image out (ex: .png)')
+    parser.add_argument(
+        '--color-by',
+        default=None,
+        help='Color / legend by this header field (ex: sn, bulb, prog_dev)')
+    parser.add_argument('--title', default=None)
+    parser.add_argument('--rebuild',
+                        action="store_true",
+                        help='Ignore cached curves')
+    parser.add_argument('jls',
+                        nargs="+",
+                        help='.jl files, directories or columnar exports')
     args = parser.parse_args()
 
-    plt.xlabel("t (sec)")
-    plt.ylabel("% erased")
-
-    for jli, (fn, header, _footer,
-              reads) in enumerate(eetime.jl.load_jls_arg(args.jls)):
-        print("")
+    runs = load_runs(args.jls, rebuild=args.rebuild)
+    for fn, _header, _seconds, _percent in runs:
         print(fn)
-        plt.title(header["prog_dev"])
-        times, percentages = decode(reads)
-        plt.plot(times, percentages, label=str(jli))
+    if not runs:
+        raise Exception("No complete runs")
 
-    plt.legend()
+    # Slow to import, don't hold up --help
+    if args.save:
+        from matplotlib.figure import Figure
+        fig = Figure()
+    else:
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+    render(fig, runs, color_by=args.color_by, title=args.title)
 
     if args.save:
-        plt.savefig(args.save)
+        fig.savefig(args.save)
     else:
         plt.show()
 
@@ -1,85 +1,25 @@
 #!/usr/bin/env python3
+"""
+numpy, scipy, sklearn and matplotlib are only imported by the functions
+that need them so that the default t50 / t100 path starts quickly
+"""
 
 import argparse
-from sklearn.linear_model import LinearRegression
-import numpy as np
-import scipy.optimize
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
 import eetime.jl
+import eetime.cache
+from eetime.analysis import lin_interp_50p, find_t100, summarize_jl
+from eetime.analysis import summarize
 import statistics
 
 
-def decode(reads):
-    times = []
-    percentages = []
-    for aread in reads:
-        times.append(aread["seconds"])
-        percentages.append(aread["erase_percent"])
-    return times, percentages
-
-
-def sigmoid(p, x):
-    x0, y0, c, k = p
-    y = c / (1 + np.exp(-k * (x - x0))) + y0
-    return y
-
-
-def residuals(p, x, y):
-    return y - sigmoid(p, x)
-
-
-def resize(arr, lower=0.0, upper=1.0):
-    arr = arr.copy()
-    if lower > upper: lower, upper = upper, lower
-    arr -= arr.min()
-    arr *= (upper - lower) / arr.max()
-    arr += lower
-    return arr
-
-
-def sigmoid_regression(x, y):
-
-    xnp = np.asarray(x)
-    ynp = np.asarray(y)
-
-    xnp = resize(-xnp, lower=0.3)
-    ynp = resize(ynp, lower=0.3)
-    p_guess = (np.median(xnp), np.median(ynp), 1.0, 1.0)
-    p, cov, infodict, mesg, ier = scipy.optimize.leastsq(residuals,
-                                                         p_guess,
-                                                         args=(xnp, ynp),
-                                                         full_output=1)
-
-    x0, y0, c, k = p
-    print('''\
-x0 = {x0}
-y0 = {y0}
-c = {c}
-k = {k}'''.format(x0=x0, y0=y0, c=c, k=k))
-    print("x0 estimate: %u" % x[int(x0 * len(x))])
-    print("c estimate: %u" % x[int(c * len(x))])
-
-
-def sigmoid_regression2(x, y):
-    xnp = np.asarray(x)
-    ynp = np.asarray(y)
-
-    def sigmoid(x, k, x0):
-        return 1.0 / (1 + np.exp(-k * (x - x0)))
-
-    print("")
-    popt, pcov = curve_fit(sigmoid, xnp, ynp)
-    estimated_k, estimated_x0 = popt
-    print(xnp)
-    print(ynp)
-
-
 def linear_regression(xs, ys):
     """
     Quick estimate of sigmoid center
     Drop everything not in middle 80%
     """
+    import numpy as np
+    from sklearn.linear_model import LinearRegression
+
     xfilt = []
     yfilt = []
     for ax, ay in zip(xs, ys):
@@ -104,6 +44,8 @@ def linear_regression(xs, ys):
 
 
 def poly_regression(xs, ys):
+    import numpy as np
+
     xfilt = []
     yfilt = []
     for ax, ay in zip(xs, ys):
@@ -123,70 +65,60 @@ def poly_regression(xs, ys):
         print("  t=%u => %0.1f%%, est %0.1f%%" % (ax, ay, est))
 
 
-def lin_interp_50p(xs, ys, thresh=50.0):
+def select_runs(jls, dataset=None):
     """
-    Linear interpolation to find the 50% erase mark
-    In practice sets increase pretty rapidly around 50% so this should be reliable
+    (fn, dataset) for each run in jls, dataset None for .jl files
+    jls may name columnar exports (see eetime.columnar)
+    dataset: take runs from this export instead of .jl files
     """
-
-    if len(xs) < 2:
-        print("WARNING: interpolation failed (insufficient entries)")
-        return 0.0
-
-    if ys[0] > 0.0:
-        print("WARNING: interpolation failed (t0 not filled)")
-        return 0.0
-
-    for i, (ax, ay) in enumerate(zip(xs, ys)):
-        if ay >= thresh:
-            break
-    else:
-        raise Exception("Interpolation failed (failed to hit thresh)")
-
-    if i == 0:
-        i = 1
-
-    # on the off chance we land at a stable point bump around
-    while True:
-        if ys[i - 1] == ys[i]:
-            print("WARNING: searching for better 50p point")
-            i += 1
+    ret = []
+    for arg in jls:
+        if dataset is not None:
+            ret += [(fn, dataset) for fn in dataset.select(arg)]
+        elif eetime.jl.is_dataset(arg):
+            from eetime import columnar
+            arg_dataset = columnar.Dataset(arg)
+            ret += [(fn, arg_dataset) for fn in arg_dataset.fns]
         else:
-            break
+            ret += [(fn, None) for fn in eetime.jl.expand_jls_arg([arg])]
+    return sorted(ret, key=lambda x: x[0])
 
-    x0 = xs[i - 1]
-    x1 = xs[i]
-    y0 = ys[i - 1]
-    y1 = ys[i]
-
-    m = (y1 - y0) / (x1 - x0)
-    c = y0 - x0 * m
-    # c = y1 - x1 * m
-
-    thalf = (50 - c) / m
-    print("thalf: %0.1f" % thalf)
-    print("  x=%u => y=%0.1f" % (x0, y0))
-    print("  x=%u => y=%0.1f" % (x1, y1))
-    return thalf
 
-
-def find_t100(ts, ps):
-    prevt = None
-    # Move backwards until we find first entry not 100%
-    # then report the last entry, which was the first stable 100%
-    for t, p in zip(reversed(ts), reversed(ps)):
-        if prevt is None:
-            assert p == 100.0
-        if p < 100.0:
-            if prevt is None:
-                return 0.0
-            else:
-                return prevt
-        prevt = t
-    return 0.0
+def load_curve(fn, dataset=None):
+    """
+    (seconds, erase_percent) arrays of a run
+    .jl files go through eetime.curves' cache instead of parsing again
+    """
+    if dataset is not None:
+        seconds = dataset.column(fn, "seconds")
+        return seconds, dataset.column(fn, "erase_percent")
+    from eetime import curves
+    _header, _footer, seconds, percent = curves.load_curve(fn)
+    return seconds, percent
 
 
-def run(jls=None, d=None):
+def print_fits(fns, fits):
+    print("")
+    print("Fits (95% CI)")
+    for i, fn in enumerate(fns):
+        if not fits["converged"][i]:
+            print("  %s: failed" % fn)
+            continue
+        print("  %s" % fn)
+        print("    t50: %0.1f sec (%0.1f - %0.1f)" %
+              (fits["t50"][i], fits["t50_lo"][i], fits["t50_hi"][i]))
+        print("    t100: %0.1f sec (%0.1f - %0.1f)" %
+              (fits["t100"][i], fits["t100_lo"][i], fits["t100_hi"][i]))
+        print("    rms error: %0.2f%%" % fits["rmse"][i])
+
+
+def run(jls=None, d=None, cache=None, dataset=None, fit=None, jobs=1):
+    """
+    cache: eetime.cache.SummaryCache to reuse per file results
+    dataset: eetime.columnar.Dataset to read runs from instead of .jl files
+    fit: also fit this eetime.fit model to every complete run
+    jobs: fit in this many worker processes
+    """
     # TODO: make explicit dir load
     if d:
         jls = [d]
@@ -195,23 +127,43 @@ def run(jls=None, d=None):
     t50s = []
     ref_header = None
     ref_footer = None
-    for jli, (fn, header, footer,
-              reads) in enumerate(eetime.jl.load_jls_arg(jls)):
+    fit_fns = []
+    curves = []
+    for fn, run_dataset in select_runs(jls, dataset=dataset):
         print("")
-        print(fn)
+        summary = None
+        if run_dataset is not None:
+            # Already parsed: faster than the cache
+            print("%s (dataset)" % fn)
+            summary = summarize(*run_dataset.run(fn))
+        elif cache:
+            summary = cache.get(fn)
+        if summary is None:
+            print(fn)
+            summary = summarize_jl(fn)
+            if cache:
+                cache.put(fn, summary)
+        elif run_dataset is None:
+            print("%s (cached)" % fn)
+            if summary["footer"]:
+                print("%u entries" % summary["entries"])
+        if not summary["footer"]:
+            continue
         if ref_header is None:
-            ref_header = header
-            ref_footer = footer
-        times, percentages = decode(reads)
-        print("%u entries" % len(times))
-        t50s.append(lin_interp_50p(times, percentages))
-        t100s.append(find_t100(times, percentages))
+            ref_header = summary["header"]
+            ref_footer = summary["footer"]
+        t50s.append(summary["t50"])
+        t100s.append(summary["t100"])
+        if fit:
+            fit_fns.append(fn)
+            curves.append(load_curve(fn, run_dataset))
 
     print("")
     print("t50s")
     for t50 in t50s:
         print("  %0.1f" % t50)
     if 0:
+        import matplotlib.pyplot as plt
         plt.plot(t50s)
         plt.show()
 
@@ -220,6 +172,7 @@ def run(jls=None, d=None):
     for t100 in t100s:
         print("  %0.1f" % t100)
     if 0:
+        import matplotlib.pyplot as plt
         plt.plot(t100s)
         plt.show()
 
@@ -239,14 +192,65 @@ def run(jls=None, d=None):
         print("  t100: %0.1f sec" % (est_t100))
         j["t100"] = est_t100
 
+    if fit:
+        from eetime import fit as efit
+        import numpy as np
+
+        fits = efit.fit_runs(curves, model=fit, jobs=jobs)
+        print_fits(fit_fns, fits)
+        ok = fits["converged"]
+        print("")
+        print("Fit summary: %u / %u converged" % (ok.sum(), len(ok)))
+        if ok.any():
+            j["t50_fit"] = float(np.median(fits["t50"][ok]))
+            j["t100_fit"] = float(np.median(fits["t100"][ok]))
+            print("  t50: %0.1f sec" % j["t50_fit"])
+            print("  t100: %0.1f sec" % j["t100_fit"])
+
     return j
 
 
 def main():
     parser = argparse.ArgumentParser(description='Help')
-    parser.add_argument('jls', nargs="+", help='')
+    parser.add_argument(
+        '--cache',
+        default=None,
+        help='Per file summary cache (ex: db/summary_cache.json)')
+    parser.add_argument(
+        '--dataset',
+        default=None,
+        help='Columnar export (export.py) to read the runs in jls from')
+    parser.add_argument('--fit',
+                        action="store_true",
+                        help='Also fit a sigmoid to every run (t50 / t100 '
+                        'with confidence intervals)')
+    parser.add_argument('--model',
+                        default="logistic",
+                        choices=("logistic", "loglogistic"),
+                        help='--fit in seconds or log(seconds)')
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=1,
+                        help='Fit in this many processes')
+    parser.add_argument('jls',
+                        nargs="+",
+                        help='.jl files, directories or columnar exports')
     args = parser.parse_args()
-    run(args.jls)
+    cache = None
+    if args.cache:
+        cache = eetime.cache.SummaryCache(args.cache)
+    dataset = None
+    if args.dataset:
+        from eetime import columnar
+        dataset = columnar.Dataset(args.dataset)
+    run(args.jls,
+        cache=cache,
+        dataset=dataset,
+        fit=args.model if args.fit else None,
+        jobs=args.jobs)
+    if cache:
+        cache.save()
+        cache.print_stats()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Stress eetime.minipro.Minipro with several programmers in parallel
+
+Each simulated programmer returns data unique to its device name
+so any cross talk between instances shows up as a mismatch
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import os
+import stat
+import sys
+import tempfile
+import time
+from eetime.minipro import Minipro
+
+# Stand-in for the minipro binary: -r writes a device specific pattern
+STANDIN = '''#!%s
+import hashlib, random, sys, time
+args = sys.argv[1:]
+device = args[args.index("-p") + 1]
+size = int(device.split("_")[-1])
+time.sleep(random.uniform(0, %f))
+if "-r" in args:
+    seed = hashlib.sha256(device.encode()).digest()
+    data = (seed * (size // len(seed) + 1))[:size]
+    fn = args[args.index("-r") + 1]
+    if fn == "-":
+        sys.stdout.buffer.write(data)
+    else:
+        with open(fn, "wb") as f:
+            f.write(data)
+'''
+
+
+def expected(device):
+    size = int(device.split("_")[-1])
+    seed = hashlib.sha256(device.encode()).digest()
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+def write_standin(d, jitter):
+    fn = os.path.join(d, "minipro")
+    with open(fn, "w") as f:
+        f.write(STANDIN % (sys.executable, jitter))
+    os.chmod(fn, os.stat(fn).st_mode | stat.S_IEXEC)
+    return fn
+
+
+def programmer(path, device, reads, stdout):
+    """Read device repeatedly, return number of bad reads"""
+    want = expected(device)
+    bad = 0
+    with Minipro(device=device, path=path, stdout=stdout) as prog:
+        for readi in range(reads):
+            # Mix fresh and reused buffers
+            code = prog.read(reuse=bool(readi % 2))["code"]
+            if code != want:
+                bad += 1
+    return bad
+
+
+def run(programmers=8, reads=20, size=32768, jitter=0.01, stdout=False):
+    with tempfile.TemporaryDirectory() as d:
+        path = write_standin(d, jitter)
+        tstart = time.time()
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=programmers) as executor:
+            # Vary the size a bit so mixed up reads are also caught by length
+            futures = [
+                executor.submit(programmer, path,
+                                "dev%u_%u" % (progi, size + progi), reads,
+                                stdout) for progi in range(programmers)
+            ]
+            bad = sum(future.result() for future in futures)
+        dt = time.time() - tstart
+    total = programmers * reads
+    print("%u programmers x %u reads: %u / %u bad in %0.1f sec" %
+          (programmers, reads, bad, total, dt))
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Parallel Minipro reads against a stand-in minipro")
+    parser.add_argument('--programmers', type=int, default=8)
+    parser.add_argument('--reads', type=int, default=20)
+    parser.add_argument('--size', type=int, default=32768)
+    parser.add_argument('--jitter',
+                        type=float,
+                        default=0.01,
+                        help='Max random delay per minipro call (sec)')
+    args = parser.parse_args()
+
+    bad = 0
+    for stdout in (False, True):
+        print("Reading via %s" % ("stdout" if stdout else "temp file"))
+        bad += run(programmers=args.programmers,
+                   reads=args.reads,
+                   size=args.size,
+                   jitter=args.jitter,
+                   stdout=stdout)
+    if bad:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
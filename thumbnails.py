@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Erase curve figure for every run directory plus an index.html
+
+    ./thumbnails.py db/prod db/thumbs
+
+Directories are rendered in parallel (Agg, see plot.render()). A figure
+newer than all of its directory's .jl files is kept, so rerunning over the
+whole database only renders what changed
+Each figure has a .json next to it with what the index shows
+"""
+
+import argparse
+import html
+import json
+import multiprocessing
+import os
+import eetime.jl
+from csv_runs import find_jl_dirs
+
+INDEX_FIELDS = ("sn", "prog_dev", "eraser", "bulb")
+THUMB_WIDTH = 320
+
+
+def figure_fn(root_dir, out_dir, d):
+    """db/prod/a/b => out_dir/a/b.png"""
+    rel = os.path.relpath(d, root_dir)
+    if rel == ".":
+        rel = os.path.basename(os.path.abspath(root_dir))
+    return os.path.join(out_dir, rel + ".png")
+
+
+def meta_fn(fn_png):
+    return os.path.splitext(fn_png)[0] + ".json"
+
+
+def up_to_date(d, fn_png):
+    if not os.path.exists(fn_png) or not os.path.exists(meta_fn(fn_png)):
+        return False
+    t = os.path.getmtime(fn_png)
+    for fn in eetime.jl.expand_jls_arg([d]):
+        if os.path.getmtime(fn) > t:
+            return False
+    return True
+
+
+def render_dir(task):
+    """
+    Render one directory. Runs in a worker process
+    Returns its metadata (also saved next to the figure)
+    """
+    d, fn_png, title = task
+    from matplotlib.figure import Figure
+    import plot
+
+    meta = {"dir": d, "runs": 0}
+    try:
+        runs = plot.load_runs([d])
+        meta["runs"] = len(runs)
+        if runs:
+            header = runs[0][1]
+            for k in INDEX_FIELDS:
+                meta[k] = header.get(k)
+            fig = Figure()
+            plot.render(fig, runs, title=title)
+            os.makedirs(os.path.dirname(fn_png), exist_ok=True)
+            tmp = fn_png + ".tmp"
+            fig.savefig(tmp, format="png")
+            os.replace(tmp, fn_png)
+        else:
+            meta["error"] = "no complete runs"
+    except Exception as e:
+        meta["error"] = str(e)
+    os.makedirs(os.path.dirname(fn_png), exist_ok=True)
+    with open(meta_fn(fn_png), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def write_index(out_dir, entries):
+    """entries: (figure fn, metadata)"""
+    fn = os.path.join(out_dir, "index.html")
+    with open(fn + ".tmp", "w") as f:
+        f.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">\n")
+        f.write("<title>Erase curves</title></head><body>\n")
+        f.write("<table>\n<tr><th></th><th>dir</th><th>runs</th>")
+        for k in INDEX_FIELDS:
+            f.write("<th>%s</th>" % html.escape(k))
+        f.write("</tr>\n")
+        for fn_png, meta in entries:
+            src = html.escape(os.path.relpath(fn_png, out_dir))
+            f.write("<tr><td>")
+            if "error" in meta:
+                f.write(html.escape(meta["error"]))
+            else:
+                f.write('<a href="%s"><img src="%s" width="%u"></a>' %
+                        (src, src, THUMB_WIDTH))
+            f.write("</td><td>%s</td><td>%u</td>" %
+                    (html.escape(meta["dir"]), meta["runs"]))
+            for k in INDEX_FIELDS:
+                f.write("<td>%s</td>" % html.escape(str(meta.get(k, ""))))
+            f.write("</tr>\n")
+        f.write("</table>\n</body></html>\n")
+    os.replace(fn + ".tmp", fn)
+    return fn
+
+
+def run(root_dir, out_dir, jobs=None, force=False):
+    """jobs: worker processes (default: CPU count)"""
+    dirs = list(find_jl_dirs(root_dir))
+    fns = [figure_fn(root_dir, out_dir, d) for d in dirs]
+    todo = []
+    for d, fn_png in zip(dirs, fns):
+        if force or not up_to_date(d, fn_png):
+            title = os.path.relpath(d, root_dir)
+            todo.append((d, fn_png, title))
+    print("%u directories, %u to render" % (len(dirs), len(todo)))
+
+    if todo:
+        with multiprocessing.Pool(jobs) as pool:
+            for meta in pool.imap_unordered(render_dir, todo):
+                if "error" in meta:
+                    print("WARNING: %s: %s" % (meta["dir"], meta["error"]))
+                else:
+                    print("%s: %u runs" % (meta["dir"], meta["runs"]))
+
+    entries = []
+    for fn_png in fns:
+        with open(meta_fn(fn_png), "r") as f:
+            entries.append((fn_png, json.load(f)))
+    print("Wrote %s" % write_index(out_dir, entries))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Erase curve figures for every run directory")
+    parser.add_argument('--jobs',
+                        type=int,
+                        default=None,
+                        help='Render in this many processes (default: CPUs)')
+    parser.add_argument('--force',
+                        action="store_true",
+                        help='Render even if a figure is up to date')
+    parser.add_argument('root_dir',
+                        default="db/prod",
+                        nargs="?",
+                        help='Directory to look around in')
+    parser.add_argument('out_dir',
+                        default="db/thumbs",
+                        nargs="?",
+                        help='Figures and index.html out')
+    args = parser.parse_args()
+
+    run(args.root_dir, args.out_dir, jobs=args.jobs, force=args.force)
+
+
+if __name__ == "__main__":
+    main()